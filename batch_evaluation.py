@@ -0,0 +1,214 @@
+import numpy as np
+from chromosome import YearPlan
+
+
+class PopulationArrays:
+    # Dense encoding of a population against the evaluator's vehicle and
+    # (vehicle, fuel) indices. Shapes are (individual, year, vehicle) for the
+    # vehicle counts and (individual, year, vehicle-fuel pair) for the
+    # kilometres driven, i.e. Num_Vehicles * Distance_per_vehicle(km).
+    def __init__(self, buy, sell, use, use_km, entry_km, entry_vehicle, entry_bucket,
+                 entry_segment):
+        self.buy = buy
+        self.sell = sell
+        self.use = use
+        self.use_km = use_km
+
+        # Flattened 'use' entries, needed by the demand check which depends on
+        # each entry's distance bucket and eligibility in its operating year
+        self.entry_km = entry_km
+        self.entry_vehicle = entry_vehicle
+        self.entry_bucket = entry_bucket
+        self.entry_segment = entry_segment
+
+
+class BatchEvaluator:
+    def __init__(self, fleet_optimization, encoding_cache_size=100000):
+        self.fleet_optimization = fleet_optimization
+        self.years = list(fleet_optimization.years)
+        self.start_year = self.years[0]
+
+        # Vehicle indices follow the model's catalog, plus (vehicle, fuel) pairs
+        catalog = fleet_optimization.catalog
+        self.vehicle_ids = catalog.ids
+        self.vehicle_index = catalog.index
+        self.pairs = [(vehicle_id, fuel)
+                      for index, vehicle_id in enumerate(catalog.ids)
+                      for fuel in catalog.fuel_consumptions[index]]
+        self.pair_index = {pair: i for i, pair in enumerate(self.pairs)}
+        self.distance_index = {bucket: i for i, bucket in enumerate(
+            fleet_optimization.distance_buckets)}
+
+        self._build_tables()
+
+        # Encoded arrays of frozen years, shared between individuals
+        self.encoding_cache_size = encoding_cache_size
+        self.year_encodings = {}
+
+    def _build_tables(self):
+        fo = self.fleet_optimization
+        num_vehicles = len(self.vehicle_ids)
+
+        catalog = fo.catalog
+        self.purchase_cost = np.array(catalog.cost)
+        self.purchase_year = np.array(catalog.year)
+
+        # Absolute per-vehicle amounts for every operating year, gathered from
+        # the model's per-vehicle, per-age tables
+        ages = np.array(self.years)[:, None] - self.purchase_year[None, :]
+        ages = np.clip(ages, 0, fo.max_profile_age)
+        vehicles = np.arange(num_vehicles)[None, :]
+        self.insurance_table = np.array(
+            fo.insurance_costs).reshape(num_vehicles, -1)[vehicles, ages]
+        self.maintenance_table = np.array(
+            fo.maintenance_costs).reshape(num_vehicles, -1)[vehicles, ages]
+        self.resale_table = np.array(
+            fo.resale_values).reshape(num_vehicles, -1)[vehicles, ages]
+
+        # Fuel cost and emissions per km, priced at the vehicle's purchase
+        # year as in FleetOptimization.calculate_fuel_cost/calculate_emissions
+        self.fuel_cost_per_km = np.empty(len(self.pairs))
+        self.emissions_per_km = np.empty(len(self.pairs))
+        for i, (vehicle_id, fuel) in enumerate(self.pairs):
+            index = catalog.index[vehicle_id]
+            consumption = catalog.fuel_consumptions[index][fuel]
+            fuel_year = fo.fuels_data[fuel][str(catalog.year[index])]
+            self.fuel_cost_per_km[i] = consumption * \
+                fuel_year['Cost ($/unit_fuel)']
+            self.emissions_per_km[i] = consumption * \
+                fuel_year['Emissions (CO2/unit_fuel)']
+
+        # Demand cells follow FleetOptimization.demand_index, ordered by size
+        # and then distance bucket
+        self.demand_index = fo.demand_index
+        size_index = {size: i for i, size in enumerate(fo.size_buckets)}
+        self.vehicle_size = np.array(
+            [size_index[size] for size in catalog.size], dtype=np.int64)
+
+        self.carbon_caps = np.array(
+            [fo.carbon_emissions[str(year)] for year in self.years], dtype=float)
+
+    def encode_year(self, year_dict):
+        # Small per-year arrays: (vehicle, count) rows for 'buy' and 'sell',
+        # and (vehicle, count, vehicle-fuel pair, km, distance bucket) rows for
+        # 'use'. Frozen years are encoded once and then reused.
+        if isinstance(year_dict, YearPlan):
+            encoded = self.year_encodings.get(year_dict)
+            if encoded is not None:
+                return encoded
+
+        vehicle_index = self.vehicle_index
+        pair_index = self.pair_index
+        distance_index = self.distance_index
+
+        buy = [(vehicle_index[vehicle['ID']], vehicle['Num_Vehicles'])
+               for vehicle in year_dict['buy']]
+        sell = [(vehicle_index[vehicle['ID']], vehicle['Num_Vehicles'])
+                for vehicle in year_dict['sell']]
+        use = []
+        for vehicle in year_dict['use']:
+            vehicle_id = vehicle['ID']
+            v = vehicle_index[vehicle_id]
+            num_used = vehicle['Num_Vehicles']
+            use.append((v,
+                        num_used,
+                        pair_index[vehicle_id, vehicle['Fuel']],
+                        num_used * vehicle['Distance_per_vehicle(km)'],
+                        distance_index[vehicle['Distance_bucket']]))
+
+        encoded = (np.array(buy, dtype=float).reshape(-1, 2),
+                   np.array(sell, dtype=float).reshape(-1, 2),
+                   np.array(use, dtype=float).reshape(-1, 5))
+
+        if isinstance(year_dict, YearPlan):
+            if len(self.year_encodings) >= self.encoding_cache_size:
+                self.year_encodings.clear()
+            self.year_encodings[year_dict] = encoded
+        return encoded
+
+    def encode(self, population):
+        num_individuals = len(population)
+        num_years = len(self.years)
+        num_vehicles = len(self.vehicle_ids)
+        num_pairs = len(self.pairs)
+        num_segments = num_individuals * num_years
+
+        groups = ([], [], [])
+        for chromosome in population:
+            for year_dict in chromosome:
+                for group, rows in zip(groups, self.encode_year(year_dict)):
+                    group.append(rows)
+
+        # Segment (individual * num_years + year) of every row
+        segment_ids = np.arange(num_segments)
+        buy, sell, use = [np.concatenate(group) if group else np.zeros((0, width))
+                          for group, width in zip(groups, (2, 2, 5))]
+        buy_segment, sell_segment, use_segment = [
+            np.repeat(segment_ids, [len(rows) for rows in group]).astype(np.int64)
+            if group else np.zeros(0, dtype=np.int64)
+            for group in groups]
+
+        dense_shape = (num_individuals, num_years, num_vehicles)
+        size = num_segments * num_vehicles
+
+        def densify(flat, weights, length, shape):
+            return np.bincount(flat, weights=weights, minlength=length).reshape(shape)
+
+        use_vehicle = use[:, 0].astype(np.int64)
+        return PopulationArrays(
+            buy=densify(buy_segment * num_vehicles + buy[:, 0].astype(np.int64),
+                        buy[:, 1], size, dense_shape),
+            sell=densify(sell_segment * num_vehicles + sell[:, 0].astype(np.int64),
+                         sell[:, 1], size, dense_shape),
+            use=densify(use_segment * num_vehicles + use_vehicle,
+                        use[:, 1], size, dense_shape),
+            use_km=densify(use_segment * num_pairs + use[:, 2].astype(np.int64),
+                           use[:, 3], num_segments * num_pairs,
+                           (num_individuals, num_years, num_pairs)),
+            entry_km=use[:, 3],
+            entry_vehicle=use_vehicle,
+            entry_bucket=use[:, 4].astype(np.int64),
+            entry_segment=use_segment)
+
+    def demand_coverage(self, arrays):
+        # km per (individual, year, cell) driven by vehicles eligible for the
+        # cell in that operating year
+        num_individuals, num_years = arrays.buy.shape[:2]
+        num_cells = len(self.demand_index.cells)
+        year = arrays.entry_segment % num_years
+        cell = self.vehicle_size[arrays.entry_vehicle] * \
+            len(self.distance_index) + arrays.entry_bucket
+        eligible = self.demand_index.eligible_mask[year,
+                                                   cell, arrays.entry_vehicle]
+        covered = np.bincount(arrays.entry_segment * num_cells + cell,
+                              weights=arrays.entry_km * eligible,
+                              minlength=num_individuals * num_years * num_cells)
+        return covered.reshape(num_individuals, num_years, num_cells)
+
+    def demand_shortfall(self, arrays):
+        return np.maximum(self.demand_index.required - self.demand_coverage(arrays), 0)
+
+    def demand_met(self, arrays):
+        # One comparison for every cell of every year of every individual
+        return (self.demand_coverage(arrays) >= self.demand_index.required).all(axis=-1)
+
+    def evaluate_arrays(self, arrays):
+        cost = arrays.buy @ self.purchase_cost
+        cost += np.einsum('pyv,yv->py', arrays.use, self.insurance_table)
+        cost += np.einsum('pyv,yv->py', arrays.use, self.maintenance_table)
+        cost += arrays.use_km @ self.fuel_cost_per_km
+        cost -= np.einsum('pyv,yv->py', arrays.sell, self.resale_table)
+
+        emissions = arrays.use_km @ self.emissions_per_km
+        feasible = (emissions <= self.carbon_caps) & self.demand_met(arrays)
+        return cost, emissions, feasible
+
+    def evaluate(self, population):
+        # Per individual and year: cost, emissions and feasibility
+        return self.evaluate_arrays(self.encode(population))
+
+    def fitness(self, population):
+        if not population:
+            return np.zeros(0)
+        cost, _, feasible = self.evaluate(population)
+        return np.where(feasible.all(axis=1), cost.sum(axis=1), np.inf)
@@ -0,0 +1,295 @@
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import numpy as np
+from chromosome import FleetEntry, YearPlan
+from fleet_decarbonization_model import FleetOptimization
+from genetic_algorithm import GeneticAlgorithm
+
+JSON_DATASET = 'dataset/mapping_and_cost_data.json'
+COMPILED_DATASET = 'dataset/mapping_and_cost_data.bin'
+BASELINE_FILE = 'benchmark_baseline.json'
+
+# Vehicle entries per year of the synthetic kernel workloads, and
+# chromosomes per population of the fitness and generation workloads
+FLEET_SIZES = (10, 50, 200)
+POPULATION_SIZES = (50, 200)
+SEED = 20230
+
+
+def time_calls(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_batches(function, calls_per_batch, repeats, min_seconds=0.02):
+    # Per-call seconds of each of repeats batches, where one call of function
+    # runs calls_per_batch calls of the kernel. Single kernel calls are too
+    # close to the timer resolution to time one at a time, so a batch
+    # repeats function until it takes at least min_seconds.
+    loops = max(1, math.ceil(min_seconds / min(time_calls(function, 3))))
+
+    def batch():
+        for _ in range(loops):
+            function()
+    return [timing / (calls_per_batch * loops) for timing in time_calls(batch, repeats)]
+
+
+def peak_memory(function):
+    # Peak bytes allocated while running function once. Measured in a
+    # separate run because tracing slows everything down.
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarise(timings, items_per_call=1, peak_bytes=None):
+    timings = np.array(timings)
+    result = {
+        'throughput': items_per_call * len(timings) / timings.sum(),
+        'p50_ms': float(np.percentile(timings, 50)) * 1000,
+        'p90_ms': float(np.percentile(timings, 90)) * 1000,
+        'p99_ms': float(np.percentile(timings, 99)) * 1000
+    }
+    if peak_bytes is not None:
+        result['peak_kb'] = peak_bytes / 1024
+    return result
+
+
+def synthetic_chromosome(fleet_optimization, rng, fleet_size):
+    # A plan that uses fleet_size vehicle entries every year: each year buys
+    # what is needed to replace the entries that aged out or were sold
+    catalog = fleet_optimization.catalog
+    by_year = {}
+    for index, year in enumerate(catalog.year):
+        by_year.setdefault(year, []).append(index)
+
+    chromosome = []
+    use = []
+    for year in fleet_optimization.years:
+        use = [vehicle for vehicle in use
+               if year - catalog.year[catalog.index[vehicle.id]] < fleet_optimization.max_vehicle_age]
+        sell = [vehicle._replace(num_vehicles=1) for vehicle in use
+                if vehicle.num_vehicles > 1 and rng.random() < 0.05]
+        buy = []
+        while len(use) < fleet_size:
+            index = rng.choice(by_year[year])
+            entry = FleetEntry(catalog.ids[index], rng.randint(1, 10),
+                               catalog.yearly_range[index], catalog.distance[index],
+                               rng.choice(sorted(catalog.fuel_consumptions[index])))
+            buy.append(entry)
+            use.append(entry)
+        chromosome.append(YearPlan(tuple(buy), tuple(sell), tuple(use)))
+    return tuple(chromosome)
+
+
+def synthetic_population(fleet_optimization, population_size, fleet_size, seed=SEED):
+    rng = random.Random(seed)
+    return [synthetic_chromosome(fleet_optimization, rng, fleet_size)
+            for _ in range(population_size)]
+
+
+def seeded_population(fleet_optimization, population_size, seed=SEED):
+    # Greedy seeds meet demand and the carbon caps, so scoring them runs
+    # through every year. Synthetic plans fail in their first year.
+    random.seed(seed)
+    ga = GeneticAlgorithm(fleet_optimization, population_size=population_size,
+                          seeding='greedy')
+    ga.generate_initial_population()
+    return ga.population
+
+
+def calibration_kernel():
+    # Fixed pure-Python work, timed to compare the speed of two hosts
+    total = 0
+    for i in range(20000):
+        total += i * i % 7
+    return total
+
+
+def benchmark_calibration(repeats=30):
+    return {'calibration': summarise(time_calls(calibration_kernel, repeats))}
+
+
+def benchmark_dataset_loading(repeats=50):
+    results = {}
+    for name, path in (('json', JSON_DATASET), ('compiled', COMPILED_DATASET)):
+        timings = time_calls(lambda: FleetOptimization(path), repeats)
+        results[name] = {
+            'median_ms': statistics.median(timings) * 1000,
+            'min_ms': min(timings) * 1000
+        }
+    return results
+
+
+def benchmark_kernels(fleet_optimization, fleet_sizes=FLEET_SIZES, chromosomes=20,
+                      repeats=30):
+    # Latency of one call per year of a plan, for each cost kernel, averaged
+    # over a batch of every year of every synthetic plan
+    fo = fleet_optimization
+    kernels = {
+        'calculate_buy_cost': lambda year, plan: fo.calculate_buy_cost(plan),
+        'calculate_costs': lambda year, plan: fo.calculate_costs(plan, year, 'insurance'),
+        'calculate_fuel_cost': lambda year, plan: fo.calculate_fuel_cost(plan),
+        'calculate_emissions': lambda year, plan: fo.calculate_emissions(plan),
+        'check_fleet_meets_demand': lambda year, plan: fo.check_fleet_meets_demand(plan, year)
+    }
+
+    results = {}
+    for fleet_size in fleet_sizes:
+        calls = [(year, plan)
+                 for chromosome in synthetic_population(fo, chromosomes, fleet_size)
+                 for year, plan in zip(fo.years, chromosome)]
+        for name, kernel in kernels.items():
+            def run_all():
+                for year, plan in calls:
+                    kernel(year, plan)
+            results[f'{name}[fleet={fleet_size}]'] = summarise(
+                time_batches(run_all, len(calls), repeats),
+                peak_bytes=peak_memory(run_all))
+    return results
+
+
+def benchmark_fitness(fleet_optimization, population_sizes=POPULATION_SIZES, repeats=3):
+    # GeneticAlgorithm.fitness of feasible plans on cold caches, one timing
+    # per chromosome
+    results = {}
+    for population_size in population_sizes:
+        population = seeded_population(fleet_optimization, population_size)
+        ga = GeneticAlgorithm(fleet_optimization,
+                              population_size=population_size)
+
+        def score_all():
+            ga.fitness_cache.clear()
+            ga.year_cache.clear()
+            for chromosome in population:
+                ga.fitness(chromosome)
+
+        timings = []
+        for _ in range(repeats):
+            ga.fitness_cache.clear()
+            ga.year_cache.clear()
+            for chromosome in population:
+                start = time.perf_counter()
+                ga.fitness(chromosome)
+                timings.append(time.perf_counter() - start)
+        results[f'fitness[population={population_size}]'] = summarise(
+            timings, peak_bytes=peak_memory(score_all))
+    return results
+
+
+def benchmark_generations(fleet_optimization, population_sizes=POPULATION_SIZES,
+                          generations=5, ga_options=None):
+    # One evolve generation from a feasible population; throughput is
+    # chromosomes per second
+    results = {}
+    for population_size in population_sizes:
+        def setup():
+            ga = GeneticAlgorithm(fleet_optimization, population_size=population_size,
+                                  **(ga_options or {}))
+            ga.population = seeded_population(fleet_optimization, population_size)
+            ga.score_population()
+            return ga
+
+        ga = setup()
+        timings = time_calls(ga.evolve_generation, generations)
+
+        ga = setup()
+        peak_bytes = peak_memory(ga.evolve_generation)
+        results[f'generation[population={population_size}]'] = summarise(
+            timings, population_size, peak_bytes)
+    return results
+
+
+def run_benchmarks(dataset_path=COMPILED_DATASET):
+    fleet_optimization = FleetOptimization(dataset_path)
+    results = benchmark_calibration()
+    results.update(benchmark_kernels(fleet_optimization))
+    results.update(benchmark_fitness(fleet_optimization))
+    results.update(benchmark_generations(fleet_optimization))
+    return results
+
+
+def save_baseline(results, file_path=BASELINE_FILE):
+    with open(file_path, 'w') as file:
+        json.dump(results, file, indent=4, sort_keys=True)
+
+
+def compare_to_baseline(results, file_path=BASELINE_FILE, tolerance=0.25):
+    # A benchmark regresses when its throughput drops, or its median latency
+    # or peak memory grows, by more than tolerance relative to the baseline.
+    # The baseline's timings are first scaled by how much slower or faster
+    # the calibration kernel runs on this host than on the one that wrote
+    # the baseline.
+    with open(file_path) as file:
+        baseline = json.load(file)
+
+    scale = 1.0
+    if 'calibration' in baseline and 'calibration' in results:
+        scale = results['calibration']['p50_ms'] / baseline['calibration']['p50_ms']
+
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None or name == 'calibration':
+            continue
+        throughput = reference['throughput'] / scale
+        p50_ms = reference['p50_ms'] * scale
+        if result['throughput'] < throughput * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.1f}/s vs {throughput:.1f}/s")
+        if result['p50_ms'] > p50_ms * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 {result['p50_ms']:.3f} ms vs {p50_ms:.3f} ms")
+        if 'peak_kb' in reference and result.get('peak_kb', 0) > reference['peak_kb'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak memory {result['peak_kb']:.0f} KB vs {reference['peak_kb']:.0f} KB")
+    return regressions
+
+
+def print_dataset_loading(results):
+    for name, result in results.items():
+        print(f"Load {name}: median = {result['median_ms']:.2f} ms, "
+              f"min = {result['min_ms']:.2f} ms")
+
+
+def print_benchmarks(results):
+    for name, result in results.items():
+        peak = f", peak = {result['peak_kb']:.0f} KB" if 'peak_kb' in result else ''
+        print(f"{name}: {result['throughput']:.1f}/s, "
+              f"p50 = {result['p50_ms']:.3f} ms, p90 = {result['p90_ms']:.3f} ms, "
+              f"p99 = {result['p99_ms']:.3f} ms{peak}")
+
+
+# Usage
+if __name__ == '__main__':
+    print_dataset_loading(benchmark_dataset_loading())
+    results = run_benchmarks()
+    print_benchmarks(results)
+
+    # Compare against the stored baseline, or record one on the first run.
+    # Timings are compared relative to the calibration kernel, which evens
+    # out most of the difference between hosts; if regressions show up on
+    # unchanged code, delete the baseline to record one on this host.
+    if os.path.exists(BASELINE_FILE):
+        regressions = compare_to_baseline(results)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+    else:
+        save_baseline(results)
+        print(f"Baseline written to {BASELINE_FILE}")
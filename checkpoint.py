@@ -0,0 +1,26 @@
+import os
+import pickle
+
+# File layout: 8-byte magic followed by a pickle of the state dict. Frozen
+# chromosomes share their years and entries, and pickle writes every shared
+# object once, so a population stays small on disk.
+MAGIC = b'FLEETGA1'
+
+
+def write_checkpoint(file_path, state):
+    # Write to a temporary file and rename, so a crash mid-write leaves the
+    # previous checkpoint intact
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+
+def read_checkpoint(file_path):
+    with open(file_path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_path} is not a genetic algorithm checkpoint")
+        return pickle.load(file)
@@ -0,0 +1,100 @@
+from collections import namedtuple
+
+ACTIONS = ('buy', 'sell', 'use')
+
+_ENTRY_KEYS = {
+    'ID': 0,
+    'Num_Vehicles': 1,
+    'Distance_per_vehicle(km)': 2,
+    'Distance_bucket': 3,
+    'Fuel': 4
+}
+_ACTION_KEYS = {action: i for i, action in enumerate(ACTIONS)}
+
+
+class FleetEntry(namedtuple('FleetEntry', ['id', 'num_vehicles', 'distance_per_vehicle',
+                                           'distance_bucket', 'fuel'])):
+    # Immutable buy/sell/use entry. It can also be read like the dicts used
+    # elsewhere, e.g. entry['Num_Vehicles'] or entry.get('Fuel', '').
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, _ENTRY_KEYS[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in _ENTRY_KEYS:
+            return tuple.__getitem__(self, _ENTRY_KEYS[key])
+        return default
+
+    def keys(self):
+        return _ENTRY_KEYS.keys()
+
+    def to_dict(self):
+        return {key: tuple.__getitem__(self, i) for key, i in _ENTRY_KEYS.items()}
+
+
+class YearPlan(namedtuple('YearPlan', ACTIONS)):
+    # Immutable year of a chromosome: tuples of FleetEntry per action. It is
+    # hashable, and readable like a {'buy': ..., 'sell': ..., 'use': ...} dict.
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, _ACTION_KEYS[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in _ACTION_KEYS:
+            return tuple.__getitem__(self, _ACTION_KEYS[key])
+        return default
+
+    def keys(self):
+        return _ACTION_KEYS.keys()
+
+    def items(self):
+        return zip(ACTIONS, tuple.__iter__(self))
+
+    def to_dict(self):
+        return {action: [entry.to_dict() for entry in entries]
+                for action, entries in self.items()}
+
+
+EMPTY_YEAR = YearPlan((), (), ())
+
+
+def freeze_entry(vehicle):
+    if isinstance(vehicle, FleetEntry):
+        return vehicle
+    return FleetEntry(vehicle['ID'],
+                      vehicle['Num_Vehicles'],
+                      vehicle.get('Distance_per_vehicle(km)'),
+                      vehicle.get('Distance_bucket'),
+                      vehicle.get('Fuel'))
+
+
+def freeze_year(year_dict):
+    if isinstance(year_dict, YearPlan):
+        return year_dict
+    return YearPlan(*(tuple(freeze_entry(vehicle) for vehicle in year_dict.get(action, ()))
+                      for action in ACTIONS))
+
+
+def freeze_chromosome(chromosome):
+    # Chromosomes are tuples of YearPlan, so children can share unchanged
+    # years with their parents
+    if isinstance(chromosome, tuple) and all(isinstance(year, YearPlan) for year in chromosome):
+        return chromosome
+    return tuple(freeze_year(year_dict) for year_dict in chromosome)
+
+
+def thaw_chromosome(chromosome):
+    return [freeze_year(year_dict).to_dict() for year_dict in chromosome]
+
+
+def replace_entry(year_plan, action, position, entry):
+    # Copy-on-write update of a single entry, sharing every other entry
+    entries = year_plan[action]
+    entries = entries[:position] + (entry,) + entries[position + 1:]
+    return year_plan._replace(**{action: entries})
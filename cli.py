@@ -0,0 +1,89 @@
+import argparse
+import os
+import random
+import time
+from fleet_decarbonization_model import FleetOptimization
+from genetic_algorithm import GeneticAlgorithm, save_best_solution
+
+DATASET = 'dataset/mapping_and_cost_data.bin'
+OUTPUT = 'best_solution.csv'
+
+
+def seed_output_file(output_file, seed, num_seeds):
+    # One CSV per seed when several run, e.g. best_solution_seed7.csv
+    if output_file is None or num_seeds == 1:
+        return output_file
+    root, extension = os.path.splitext(output_file)
+    return f'{root}_seed{seed}{extension}'
+
+
+def run(fleet_optimization, seed, output_file=None, **ga_options):
+    # One seeded GA run on an already loaded model
+    random.seed(seed)
+    start_time = time.perf_counter()
+    ga = GeneticAlgorithm(fleet_optimization, **ga_options)
+    best_solution = ga.evolve()
+    if output_file is not None:
+        save_best_solution(best_solution, output_file)
+    return {
+        'seed': seed,
+        'best_chromosome': best_solution,
+        'best_fitness': ga.best_fitness,
+        'generations': ga.generation,
+        'stop_reason': ga.stop_reason,
+        'elapsed_seconds': time.perf_counter() - start_time,
+        'output_file': output_file
+    }
+
+
+def run_seeds(fleet_optimization, seeds, output_file=None, **ga_options):
+    # The model is loaded once and shared by every run
+    return [run(fleet_optimization, seed,
+                seed_output_file(output_file, seed, len(seeds)), **ga_options)
+            for seed in seeds]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Optimise a fleet decarbonisation plan with the genetic algorithm.')
+    parser.add_argument('--dataset', default=DATASET,
+                        help='compiled (.bin) or JSON dataset to load')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[33],
+                        help='one run per seed, all on the same loaded dataset')
+    parser.add_argument('--population-size', type=int, default=100)
+    parser.add_argument('--generations', type=int, default=650)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes to score children in (default: none)')
+    parser.add_argument('--seeding', choices=('random', 'greedy'), default='random',
+                        help='how the initial population is built')
+    parser.add_argument('--repair', action='store_true',
+                        help='repair the initial population and every child')
+    parser.add_argument('--output', default=OUTPUT,
+                        help='best plan CSV; suffixed with the seed when several run')
+    parser.add_argument('--build-dataset', action='store_true',
+                        help='rebuild the dataset from the CSVs first if they changed')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.build_dataset:
+        # Loads pandas, so only on request
+        from json_file_creation import update_dataset
+        update_dataset()
+
+    fleet_optimization = FleetOptimization(args.dataset)
+    results = run_seeds(fleet_optimization, args.seeds, args.output,
+                        population_size=args.population_size,
+                        generations=args.generations, workers=args.workers,
+                        seeding=args.seeding, repair=args.repair)
+    for result in results:
+        print(f"Seed {result['seed']}: Best Fitness = {result['best_fitness']}, "
+              f"{result['generations']} generations ({result['stop_reason']}) "
+              f"in {result['elapsed_seconds']:.1f} s -> {result['output_file']}")
+    return results
+
+
+# Usage
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+import json
+import os
+import numpy as np
+
+# File layout: 8-byte magic, little-endian uint64 header length, a JSON
+# header with the labels and array directory, then the raw arrays, each
+# aligned to ALIGNMENT bytes so they can be viewed straight from a memory map
+MAGIC = b'FLEETDS1'
+ALIGNMENT = 64
+
+FUEL_COLUMNS = ['Emissions (CO2/unit_fuel)',
+                'Cost ($/unit_fuel)', 'Cost Uncertainty (±%)']
+VEHICLE_COLUMNS = {'cost': 'vehicle_cost',
+                   'yearly range': 'vehicle_yearly_range'}
+
+
+def _padding(offset):
+    return (-offset) % ALIGNMENT
+
+
+def compile_dataset(data):
+    # Normalise keys to strings exactly as json.load would return them
+    data = json.loads(json.dumps(data))
+
+    years = list(data['yearly_demand'].keys())
+    sizes = list(data['size_mapping'].keys())
+    distance_buckets = list(data['distance_mapping'].keys())
+    vehicle_ids = list(data['vehicle_details'].keys())
+    vehicle_index = {vehicle_id: i for i, vehicle_id in enumerate(vehicle_ids)}
+    fuels = list(data['fuels_data'].keys())
+    fuel_years = list(data['fuels_data'][fuels[0]].keys()) if fuels else []
+    consumption_ids = list(data['vehicle_fuel_consumptions'].keys())
+
+    arrays = {
+        'carbon_emissions': np.asarray(
+            [data['carbon_emissions'][year] for year in data['carbon_emissions']]),
+        'yearly_demand': np.asarray(
+            [[[data['yearly_demand'][year][size][distance] for distance in distance_buckets]
+              for size in sizes]
+             for year in years]).reshape(len(years), len(sizes), len(distance_buckets)),
+    }
+    for column, name in VEHICLE_COLUMNS.items():
+        arrays[name] = np.asarray(
+            [data['vehicle_details'][vehicle_id][column] for vehicle_id in vehicle_ids])
+    arrays['vehicle_size'] = np.asarray(
+        [sizes.index(data['vehicle_details'][vehicle_id]['size']) for vehicle_id in vehicle_ids],
+        dtype=np.int8)
+    arrays['vehicle_distance'] = np.asarray(
+        [distance_buckets.index(data['vehicle_details'][vehicle_id]['distance'])
+         for vehicle_id in vehicle_ids],
+        dtype=np.int8)
+
+    # Fuel consumptions as a dense (vehicle, fuel) table, NaN where the
+    # vehicle cannot use the fuel, plus each vehicle's fuel order
+    consumption = np.full((len(consumption_ids), len(fuels)), np.nan)
+    consumption_fuels = []
+    for i, vehicle_id in enumerate(consumption_ids):
+        vehicle_fuels = data['vehicle_fuel_consumptions'][vehicle_id]
+        consumption_fuels.append([fuels.index(fuel) for fuel in vehicle_fuels])
+        for fuel, value in vehicle_fuels.items():
+            consumption[i, fuels.index(fuel)] = value
+    arrays['vehicle_fuel_consumption'] = consumption
+
+    for c, column in enumerate(FUEL_COLUMNS):
+        arrays[f'fuel_column_{c}'] = np.asarray(
+            [[data['fuels_data'][fuel][year][column] for year in fuel_years] for fuel in fuels]
+        ).reshape(len(fuels), len(fuel_years))
+
+    # Eligible vehicles per (year, size, distance) cell as a flat index list
+    # with offsets, which keeps the original list order
+    coverage_years = list(data['vehicle_bucket_coverage'].keys())
+    coverage_index = []
+    coverage_offsets = [0]
+    for year in coverage_years:
+        for size in sizes:
+            for distance in distance_buckets:
+                coverage_index.extend(
+                    vehicle_index[vehicle_id]
+                    for vehicle_id in data['vehicle_bucket_coverage'][year][size][distance])
+                coverage_offsets.append(len(coverage_index))
+    arrays['coverage_index'] = np.asarray(coverage_index, dtype=np.int32)
+    arrays['coverage_offsets'] = np.asarray(coverage_offsets, dtype=np.int64)
+
+    header = {
+        'size_mapping': data['size_mapping'],
+        'distance_mapping': data['distance_mapping'],
+        'distance_buckets_mapping': data['distance_buckets_mapping'],
+        'cost_percentages': data['cost_percentages'],
+        'carbon_emission_years': list(data['carbon_emissions'].keys()),
+        'years': years,
+        'sizes': sizes,
+        'distance_buckets': distance_buckets,
+        'vehicle_ids': vehicle_ids,
+        'consumption_ids': consumption_ids,
+        'consumption_fuels': consumption_fuels,
+        'fuels': fuels,
+        'fuel_years': fuel_years,
+        'fuel_columns': FUEL_COLUMNS,
+        'coverage_years': coverage_years,
+    }
+    return header, arrays
+
+
+def write_compiled_dataset(file_path, data):
+    header, arrays = compile_dataset(data)
+
+    # Lay the arrays out after the header, then write header and data
+    directory = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        directory[name] = {'dtype': array.dtype.str,
+                           'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes + _padding(array.nbytes)
+
+    header['arrays'] = directory
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = len(MAGIC) + 8 + len(header_bytes)
+    data_start += _padding(data_start)
+    header['data_start'] = data_start
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Re-pad in case recording data_start grew the header
+    while len(MAGIC) + 8 + len(header_bytes) > data_start:
+        data_start += ALIGNMENT
+        header['data_start'] = data_start
+        header_bytes = json.dumps(header).encode('utf-8')
+
+    # Write to a temporary file and rename, so readers never see a partial file
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(header_bytes).to_bytes(8, 'little'))
+        file.write(header_bytes)
+        file.write(b'\0' * (data_start - file.tell()))
+        for name, array in arrays.items():
+            file.write(array.tobytes())
+            file.write(b'\0' * _padding(array.nbytes))
+    os.replace(temp_path, file_path)
+
+
+class CompiledDataset:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # Read-only memory map, shared between processes through the page cache
+        self.buffer = np.memmap(file_path, dtype=np.uint8, mode='r')
+        if bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{file_path} is not a compiled fleet dataset")
+        header_length = int.from_bytes(
+            bytes(self.buffer[len(MAGIC):len(MAGIC) + 8]), 'little')
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(
+            bytes(self.buffer[header_start:header_start + header_length]).decode('utf-8'))
+
+        data_start = self.header['data_start']
+        self.arrays = {}
+        for name, entry in self.header['arrays'].items():
+            self.arrays[name] = np.ndarray(tuple(entry['shape']), dtype=np.dtype(entry['dtype']),
+                                           buffer=self.buffer, offset=data_start + entry['offset'])
+
+    def __reduce__(self):
+        # Pickled as its path: an unpickled copy maps the same file again
+        return (CompiledDataset, (self.file_path,))
+
+    def to_data(self):
+        # The small, JSON-compatible part of the dataset, as json.load
+        # returns it. FleetOptimization reads vehicles and demand cells
+        # straight from the arrays; vehicle_data() rebuilds their dicts.
+        header = self.header
+        arrays = self.arrays
+        years = header['years']
+        sizes = header['sizes']
+        distance_buckets = header['distance_buckets']
+        fuels = header['fuels']
+
+        yearly_demand = arrays['yearly_demand'].tolist()
+        fuel_columns = [arrays[f'fuel_column_{c}'].tolist()
+                        for c in range(len(header['fuel_columns']))]
+
+        return {
+            'size_mapping': header['size_mapping'],
+            'distance_mapping': header['distance_mapping'],
+            'distance_buckets_mapping': header['distance_buckets_mapping'],
+            'cost_percentages': header['cost_percentages'],
+            'carbon_emissions': dict(zip(header['carbon_emission_years'],
+                                         arrays['carbon_emissions'].tolist())),
+            'yearly_demand': {
+                year: {size: dict(zip(distance_buckets, yearly_demand[y][s]))
+                       for s, size in enumerate(sizes)}
+                for y, year in enumerate(years)
+            },
+            'fuels_data': {
+                fuel: {
+                    year: {column: fuel_columns[c][f][y]
+                           for c, column in enumerate(header['fuel_columns'])}
+                    for y, year in enumerate(header['fuel_years'])
+                }
+                for f, fuel in enumerate(fuels)
+            }
+        }
+
+    def vehicle_data(self):
+        # vehicle_bucket_coverage, vehicle_details and
+        # vehicle_fuel_consumptions as json.load returns them
+        header = self.header
+        arrays = self.arrays
+        sizes = header['sizes']
+        distance_buckets = header['distance_buckets']
+        vehicle_ids = header['vehicle_ids']
+        fuels = header['fuels']
+
+        vehicle_columns = {column: arrays[name].tolist()
+                           for column, name in VEHICLE_COLUMNS.items()}
+        vehicle_size = arrays['vehicle_size'].tolist()
+        vehicle_distance = arrays['vehicle_distance'].tolist()
+        consumption = arrays['vehicle_fuel_consumption'].tolist()
+        coverage_index = arrays['coverage_index'].tolist()
+        coverage_offsets = arrays['coverage_offsets'].tolist()
+
+        cells = iter(range(len(coverage_offsets) - 1))
+        vehicle_bucket_coverage = {}
+        for year in header['coverage_years']:
+            vehicle_bucket_coverage[year] = {}
+            for size in sizes:
+                vehicle_bucket_coverage[year][size] = {}
+                for distance in distance_buckets:
+                    cell = next(cells)
+                    vehicle_bucket_coverage[year][size][distance] = [
+                        vehicle_ids[i] for i in coverage_index[coverage_offsets[cell]:coverage_offsets[cell + 1]]]
+
+        return {
+            'vehicle_bucket_coverage': vehicle_bucket_coverage,
+            'vehicle_details': {
+                vehicle_id: {
+                    'cost': vehicle_columns['cost'][i],
+                    'size': sizes[vehicle_size[i]],
+                    'distance': distance_buckets[vehicle_distance[i]],
+                    'yearly range': vehicle_columns['yearly range'][i]
+                }
+                for i, vehicle_id in enumerate(vehicle_ids)
+            },
+            'vehicle_fuel_consumptions': {
+                vehicle_id: {fuels[f]: consumption[i][f] for f in header['consumption_fuels'][i]}
+                for i, vehicle_id in enumerate(header['consumption_ids'])
+            }
+        }
@@ -1,15 +1,318 @@
 import json
+import os
 import re
+import numpy as np
+
+COMPILED_EXTENSION = '.bin'
+
+
+def open_compiled_dataset(file_path):
+    # The memory-mapped dataset behind a .bin path, or None for JSON (also
+    # when the compiled file is missing and the JSON next to it is used)
+    if file_path.endswith(COMPILED_EXTENSION) and os.path.exists(file_path):
+        from compiled_dataset import CompiledDataset
+        return CompiledDataset(file_path)
+    return None
+
+
+def json_dataset_path(file_path):
+    if file_path.endswith(COMPILED_EXTENSION):
+        return file_path[:-len(COMPILED_EXTENSION)] + '.json'
+    return file_path
+
+
+def load_dataset(file_path):
+    # The dataset as json.load returns it, from either format
+    compiled = open_compiled_dataset(file_path)
+    if compiled is not None:
+        data = compiled.to_data()
+        data.update(compiled.vehicle_data())
+        return data
+
+    with open(json_dataset_path(file_path), 'r') as file:
+        return json.load(file)
+
+
+class VehicleCatalog:
+    # Vehicle attributes compiled once into parallel lists, indexed by the
+    # integer position of each vehicle ID
+    def __init__(self, vehicle_details=None, vehicle_fuel_consumptions=None):
+        self.ids = []
+        self.index = {}
+        self.year = []
+        self.cost = []
+        self.size = []
+        self.distance = []
+        self.yearly_range = []
+        self.fuel_consumptions = []
+        self.details = []
+
+        for vehicle_id in sorted(vehicle_details or {}):
+            vehicle_data = vehicle_details[vehicle_id]
+            self.add(vehicle_id, vehicle_data['cost'], vehicle_data['size'],
+                     vehicle_data['distance'], vehicle_data['yearly range'],
+                     vehicle_fuel_consumptions.get(vehicle_id, {}))
+
+    def add(self, vehicle_id, cost, size, distance, yearly_range, fuel_consumptions):
+        # The purchase year is encoded in the ID, e.g. BEV_S1_2023
+        match = re.search(r'_(\d{4})$', vehicle_id)
+        if not match:
+            return
+        purchase_year = int(match.group(1))
+
+        self.index[vehicle_id] = len(self.ids)
+        self.ids.append(vehicle_id)
+        self.year.append(purchase_year)
+        self.cost.append(float(cost))
+        self.size.append(size)
+        self.distance.append(distance)
+        self.yearly_range.append(yearly_range)
+        self.fuel_consumptions.append(fuel_consumptions)
+        self.details.append({
+            'year': purchase_year,
+            'cost': cost,
+            'size': size,
+            'distance': distance,
+            'yearly range': yearly_range
+        })
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self.index
+
+
+def compiled_catalog(dataset):
+    # The same catalog as VehicleCatalog(vehicle_details, ...), read straight
+    # from the compiled arrays
+    header = dataset.header
+    arrays = dataset.arrays
+    sizes = header['sizes']
+    distance_buckets = header['distance_buckets']
+    fuels = header['fuels']
+    cost = arrays['vehicle_cost'].tolist()
+    yearly_range = arrays['vehicle_yearly_range'].tolist()
+    size = arrays['vehicle_size'].tolist()
+    distance = arrays['vehicle_distance'].tolist()
+
+    consumption = arrays['vehicle_fuel_consumption'].tolist()
+    consumption_row = {vehicle_id: i for i, vehicle_id in enumerate(header['consumption_ids'])}
+
+    catalog = VehicleCatalog()
+    for i, vehicle_id in sorted(enumerate(header['vehicle_ids']), key=lambda item: item[1]):
+        row = consumption_row.get(vehicle_id)
+        fuel_consumptions = {} if row is None else {
+            fuels[f]: consumption[row][f] for f in header['consumption_fuels'][row]}
+        catalog.add(vehicle_id, cost[i], sizes[size[i]], distance_buckets[distance[i]],
+                    yearly_range[i], fuel_consumptions)
+    return catalog
+
+
+class FleetState:
+    # Vehicles currently owned, indexed by vehicle ID and bucketed by
+    # purchase year, with a running total of the fleet size. Iterating
+    # yields {'ID', 'Num_Vehicles', 'Purchase_Year'} dicts.
+    def __init__(self):
+        self.holdings = {}
+        self.by_purchase_year = {}
+        self.total_vehicles = 0
+
+    def __iter__(self):
+        return iter(list(self.holdings.values()))
+
+    def __len__(self):
+        return len(self.holdings)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self.holdings
+
+    def get(self, vehicle_id):
+        return self.holdings.get(vehicle_id)
+
+    def add(self, vehicle_id, num_vehicles, purchase_year):
+        holding = self.holdings.get(vehicle_id)
+        if holding:
+            holding['Num_Vehicles'] += num_vehicles
+        else:
+            self.holdings[vehicle_id] = {
+                'ID': vehicle_id,
+                'Num_Vehicles': num_vehicles,
+                'Purchase_Year': purchase_year
+            }
+            self.by_purchase_year.setdefault(
+                purchase_year, set()).add(vehicle_id)
+        self.total_vehicles += num_vehicles
+
+    def remove(self, vehicle_id, num_vehicles):
+        holding = self.holdings[vehicle_id]
+        if num_vehicles < holding['Num_Vehicles']:
+            holding['Num_Vehicles'] -= num_vehicles
+            self.total_vehicles -= num_vehicles
+        else:
+            self._drop(vehicle_id)
+
+    def _drop(self, vehicle_id):
+        holding = self.holdings.pop(vehicle_id)
+        self.total_vehicles -= holding['Num_Vehicles']
+        bucket = self.by_purchase_year[holding['Purchase_Year']]
+        bucket.discard(vehicle_id)
+        if not bucket:
+            del self.by_purchase_year[holding['Purchase_Year']]
+
+    def retire(self, year, max_age):
+        # Drop whole purchase-year buckets that have reached max_age
+        for purchase_year in [y for y in self.by_purchase_year if year - y >= max_age]:
+            for vehicle_id in self.by_purchase_year.pop(purchase_year):
+                holding = self.holdings.pop(vehicle_id)
+                self.total_vehicles -= holding['Num_Vehicles']
+
+
+class DemandIndex:
+    # Per operating year: the km required in every (size, distance bucket)
+    # cell and the vehicles eligible to serve it (vehicle_bucket_coverage).
+    # required is a (year, cell) array and coverage[y][cell] the catalog
+    # indices of the vehicles eligible for the cell.
+    def __init__(self, years, cells, required, coverage, catalog):
+        self.start_year = years[0]
+        self.years = years
+        self.catalog = catalog
+        self.cells = cells
+        self.cell_index = {cell: i for i, cell in enumerate(self.cells)}
+        self.required = np.array(required, dtype=float)
+
+        self.eligible = []
+        positions = ([], [], [])
+        for y, year_coverage in enumerate(coverage):
+            year_eligible = []
+            for c, indices in enumerate(year_coverage):
+                year_eligible.append(frozenset(
+                    [catalog.ids[index] for index in indices]))
+                positions[0].extend([y] * len(indices))
+                positions[1].extend([c] * len(indices))
+                positions[2].extend(indices)
+            self.eligible.append(year_eligible)
+        self.eligible_mask = np.zeros(
+            (len(years), len(self.cells), len(catalog)), dtype=bool)
+        self.eligible_mask[positions] = True
+
+    def coverage(self, individual, current_year):
+        # km driven in each cell by vehicles eligible for it this year
+        catalog = self.catalog
+        cell_index = self.cell_index
+        eligible = self.eligible[current_year - self.start_year]
+        covered = [0.0] * len(self.cells)
+        for vehicle in individual['use']:
+            vehicle_id = vehicle['ID']
+            index = catalog.index.get(vehicle_id)
+            if index is None:
+                continue
+            cell = cell_index.get(
+                (catalog.size[index], vehicle['Distance_bucket']))
+            if cell is not None and vehicle_id in eligible[cell]:
+                covered[cell] += vehicle['Num_Vehicles'] * \
+                    vehicle['Distance_per_vehicle(km)']
+        return np.array(covered)
+
+    def shortfall(self, covered, current_year):
+        return np.maximum(self.required[current_year - self.start_year] - covered, 0)
+
+    def short_cells(self, shortfall):
+        return {self.cells[c]: float(shortfall[c]) for c in np.flatnonzero(shortfall)}
+
+
+def demand_from_data(years, cells, yearly_demand, vehicle_bucket_coverage, catalog):
+    # DemandIndex inputs from the JSON-style dicts. Vehicles missing from
+    # the catalog can never be used, so they are left out.
+    required = [[yearly_demand[str(year)][size][bucket] for size, bucket in cells]
+                for year in years]
+    coverage = []
+    for year in years:
+        year_coverage = vehicle_bucket_coverage.get(str(year), {})
+        coverage.append([[catalog.index[vehicle_id]
+                          for vehicle_id in year_coverage.get(size, {}).get(bucket, ())
+                          if vehicle_id in catalog.index]
+                         for size, bucket in cells])
+    return required, coverage
+
+
+def demand_from_compiled(dataset, years, cells, catalog):
+    # DemandIndex inputs from the compiled arrays, whose cells are laid out
+    # size-major like DemandIndex.cells
+    header = dataset.header
+    arrays = dataset.arrays
+    demand_years = {year: y for y, year in enumerate(header['years'])}
+    demand = arrays['yearly_demand'].reshape(len(header['years']), -1)
+    required = [demand[demand_years[str(year)]] for year in years]
+
+    # Dataset vehicle positions to catalog indices, -1 for unknown IDs
+    to_catalog = np.array([catalog.index.get(vehicle_id, -1)
+                           for vehicle_id in header['vehicle_ids']], dtype=np.int64)
+    entries = to_catalog[arrays['coverage_index']] if len(to_catalog) else \
+        np.zeros(0, dtype=np.int64)
+    offsets = arrays['coverage_offsets']
+
+    coverage_years = {year: y for y, year in enumerate(header['coverage_years'])}
+    coverage = []
+    for year in years:
+        y = coverage_years.get(str(year))
+        if y is None:
+            coverage.append([[] for _ in cells])
+            continue
+        start = y * len(cells)
+        year_coverage = []
+        for cell in range(start, start + len(cells)):
+            indices = entries[offsets[cell]:offsets[cell + 1]]
+            year_coverage.append(indices[indices >= 0].tolist())
+        coverage.append(year_coverage)
+    return required, coverage
+
+
+# Attributes FleetOptimization builds from the dataset rather than loads
+VEHICLE_DICTS = ('vehicle_details', 'vehicle_bucket_coverage', 'vehicle_fuel_consumptions')
+RANKINGS = ('fuel_options', 'new_vehicle_options', 'cleanest_new_emissions')
+DERIVED_TABLES = ('vehicle_ids', 'catalog', 'distance_levels', 'maintenance_percentages',
+                  'insurance_percentages', 'resale_percentages', 'max_profile_age',
+                  'maintenance_by_age', 'insurance_by_age', 'resale_by_age',
+                  'maintenance_costs', 'insurance_costs', 'resale_values',
+                  'fuel_emission_factors', 'fuel_unit_costs', 'demand_index')
 
 
 class FleetOptimization:
 
     hard_constraint_penalty = 1000  # class attribute
 
+    # Weight of one unit of each violation in the penalty, as a multiple of
+    # hard_constraint_penalty. Units: kg CO2 over the cap, km of unmet
+    # demand, km over a vehicle's yearly range and vehicles otherwise, which
+    # are weighted so one vehicle costs more than buying it.
+    constraint_weights = {
+        'invalid_vehicle': 1000,
+        'buy_year': 1000,
+        'not_owned': 1000,
+        'insufficient_vehicles': 1000,
+        'sell_cap': 1000,
+        'distance_bucket': 1000,
+        'yearly_range': 1,
+        'fuel': 1000,
+        'emissions': 1,
+        'demand': 1
+    }
+
     def __init__(self, json_file_path):
-        # Load the JSON file
-        with open(json_file_path, 'r') as file:
-            data = json.load(file)
+        # Load the compiled dataset or the JSON file. A compiled dataset is
+        # read straight into the catalog and demand index; its vehicle dicts
+        # (vehicle_details, vehicle_bucket_coverage and
+        # vehicle_fuel_consumptions) are only built if something reads them.
+        self.dataset_path = json_file_path
+        self.compiled = open_compiled_dataset(json_file_path)
+        if self.compiled is not None:
+            data = self.compiled.to_data()
+        else:
+            data = load_dataset(json_file_path)
+            self.vehicle_details = data['vehicle_details']
+            self.vehicle_bucket_coverage = data['vehicle_bucket_coverage']
+            self.vehicle_fuel_consumptions = data['vehicle_fuel_consumptions']
 
         # Initialize attributes from JSON data
         self.size_mapping = data['size_mapping']
@@ -18,13 +321,8 @@ class FleetOptimization:
         self.cost_percentages = data['cost_percentages']
         self.carbon_emissions = data['carbon_emissions']
         self.yearly_demand = data['yearly_demand']
-        self.vehicle_details = data['vehicle_details']
-        self.vehicle_bucket_coverage = data['vehicle_bucket_coverage']
-        self.vehicle_fuel_consumptions = data['vehicle_fuel_consumptions']
         self.fuels_data = data['fuels_data']
 
-        # Extract vehicle IDs
-        self.vehicle_ids = self._extract_vehicle_ids()
         self.years = list(range(2023, 2039))
         self.size_buckets = list(self.size_mapping.keys())
         self.distance_buckets = list(self.distance_mapping.keys())
@@ -32,12 +330,78 @@ class FleetOptimization:
 
         # At most 20% of vehicles can be sold every year
         self.max_sell_percentage = 0.2
+        # Vehicles leave the fleet once they are 10 years old
+        self.max_vehicle_age = 10
+
+        self.initialize_tables()
+
+        # Initialize existing fleet state
+        self.existing_fleet = FleetState()
+
+    def initialize_tables(self):
+        # Catalog, cost tables and demand index derived from the dataset. The
+        # cost and emission rankings (RANKINGS) used to repair and construct
+        # plans are only built if something reads them.
+        if self.compiled is not None:
+            self.vehicle_ids = set(self.compiled.header['vehicle_ids'])
+            self.catalog = compiled_catalog(self.compiled)
+        else:
+            self.vehicle_ids = self._extract_vehicle_ids()
+            self.catalog = VehicleCatalog(
+                self.vehicle_details, self.vehicle_fuel_consumptions)
+
+        # Number of distance buckets a vehicle of each bucket can cover
+        self.distance_levels = {bucket: len(covered)
+                                for bucket, covered in self.distance_buckets_mapping.items()}
 
         # Initialize percentage values for maintenance, insurance, and resale
         self.initialize_percentage_values()
 
-        # Initialize existing fleet list
-        self.existing_fleet = []
+        # Fuel emission factors and prices of each vehicle's purchase year
+        self.initialize_fuel_tables()
+
+        # Required km and eligible vehicles per operating year and cell
+        cells = [(size, bucket)
+                 for size in self.size_buckets for bucket in self.distance_buckets]
+        if self.compiled is not None:
+            required, coverage = demand_from_compiled(
+                self.compiled, self.years, cells, self.catalog)
+        else:
+            required, coverage = demand_from_data(self.years, cells, self.yearly_demand,
+                                                  self.vehicle_bucket_coverage, self.catalog)
+        self.demand_index = DemandIndex(
+            self.years, cells, required, coverage, self.catalog)
+
+    def __getattr__(self, name):
+        # Only called for missing attributes: builds the vehicle dicts of a
+        # compiled dataset and the rankings on first use
+        if name in VEHICLE_DICTS and self.__dict__.get('compiled') is not None:
+            self.__dict__.update(self.compiled.vehicle_data())
+            return self.__dict__[name]
+        if name in RANKINGS and 'demand_index' in self.__dict__:
+            self.initialize_rankings()
+            return self.__dict__[name]
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __getstate__(self):
+        # A compiled model is pickled without the tables it derives from the
+        # file, so pool workers receive a few KB and rebuild them from their
+        # own memory map of it. The loaded dicts (caps, prices, cost
+        # percentages) are pickled, so changes made to them are kept.
+        state = dict(self.__dict__)
+        if self.compiled is not None:
+            for name in DERIVED_TABLES + VEHICLE_DICTS + RANKINGS:
+                state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'catalog' not in state:
+            self.initialize_tables()
+
+    def reset_fleet(self):
+        self.existing_fleet = FleetState()
 
     def _extract_vehicle_ids(self):
         return set(self.vehicle_details.keys())
@@ -50,80 +414,148 @@ class FleetOptimization:
         self.resale_percentages = {
             year: self.cost_percentages[year]['resale'] for year in self.cost_percentages}
 
+        # Percentages indexed by integer age. Age 0 uses the first profile
+        # year and ages past the last profile year are clamped to it.
+        profile_ages = sorted(int(age) for age in self.cost_percentages)
+        self.max_profile_age = profile_ages[-1]
+        age_keys = []
+        for age in range(self.max_profile_age + 1):
+            eligible = [a for a in profile_ages if a <= age]
+            age_keys.append(str(eligible[-1] if eligible else profile_ages[0]))
+        self.maintenance_by_age = [
+            self.maintenance_percentages[key] for key in age_keys]
+        self.insurance_by_age = [
+            self.insurance_percentages[key] for key in age_keys]
+        self.resale_by_age = [self.resale_percentages[key] for key in age_keys]
+
+        # Absolute amounts per catalog vehicle index and age
+        self.maintenance_costs = [[cost * percentage + cost for percentage in self.maintenance_by_age]
+                                  for cost in self.catalog.cost]
+        self.insurance_costs = [[cost * percentage + cost for percentage in self.insurance_by_age]
+                                for cost in self.catalog.cost]
+        self.resale_values = [[cost * percentage + cost for percentage in self.resale_by_age]
+                              for cost in self.catalog.cost]
+
+    def initialize_fuel_tables(self):
+        # fuel_emission_factors[index][fuel] and fuel_unit_costs[index][fuel]
+        # at the vehicle's purchase year, as calculate_emissions and
+        # calculate_fuel_cost price them
+        catalog = self.catalog
+        self.fuel_emission_factors = []
+        self.fuel_unit_costs = []
+        for index, consumptions in enumerate(catalog.fuel_consumptions):
+            year_key = str(catalog.year[index])
+            emission_factors = {}
+            unit_costs = {}
+            for fuel in consumptions:
+                fuel_year = self.fuels_data.get(fuel, {}).get(year_key)
+                if fuel_year is not None:
+                    emission_factors[fuel] = fuel_year['Emissions (CO2/unit_fuel)']
+                    unit_costs[fuel] = fuel_year['Cost ($/unit_fuel)']
+            self.fuel_emission_factors.append(emission_factors)
+            self.fuel_unit_costs.append(unit_costs)
+
+    def initialize_rankings(self):
+        catalog = self.catalog
+        demand_index = self.demand_index
+
+        # fuel_options[y][index]: (emissions per km, fuel cost per km, fuel)
+        # for every fuel of the vehicle, lowest emissions first; empty when
+        # the vehicle is not in service in the year.
+        # new_vehicle_options[y][cell]: (first-year cost per km, emissions per
+        # km, index, fuel) for every vehicle that can be bought in the year
+        # and serve the cell, cheapest first.
+        # cleanest_new_emissions[y, cell]: lowest emissions per km among them.
+        self.fuel_options = []
+        self.new_vehicle_options = []
+        self.cleanest_new_emissions = np.zeros(
+            (len(self.years), len(demand_index.cells)))
+        by_year = {}
+        for index, year in enumerate(catalog.year):
+            by_year.setdefault(year, []).append(index)
+        for y, year in enumerate(self.years):
+            year_key = str(year)
+            prices = {fuel: (fuel_years[year_key]['Emissions (CO2/unit_fuel)'],
+                             fuel_years[year_key]['Cost ($/unit_fuel)'])
+                      for fuel, fuel_years in self.fuels_data.items() if year_key in fuel_years}
+            fuel_options = []
+            for index in range(len(catalog)):
+                if not 0 <= year - catalog.year[index] < self.max_vehicle_age:
+                    fuel_options.append([])
+                    continue
+                options = []
+                for fuel, consumption in catalog.fuel_consumptions[index].items():
+                    emission, price = prices[fuel]
+                    options.append(
+                        (consumption * emission, consumption * price, fuel))
+                options.sort()
+                fuel_options.append(options)
+            self.fuel_options.append(fuel_options)
+
+            cell_options = []
+            for eligible in demand_index.eligible[y]:
+                options = []
+                for index in by_year.get(year, ()):
+                    if catalog.ids[index] not in eligible:
+                        continue
+                    fixed_cost_per_km = (catalog.cost[index] + self.insurance_costs[index][0] +
+                                         self.maintenance_costs[index][0]) / catalog.yearly_range[index]
+                    for emissions_per_km, fuel_cost_per_km, fuel in fuel_options[index]:
+                        options.append((fixed_cost_per_km + fuel_cost_per_km,
+                                        emissions_per_km, index, fuel))
+                options.sort()
+                cell_options.append(options)
+                if options:
+                    self.cleanest_new_emissions[y, len(cell_options) - 1] = min(
+                        option[1] for option in options)
+            self.new_vehicle_options.append(cell_options)
+
+    def age_index(self, age):
+        if age < 0:
+            return 0
+        if age > self.max_profile_age:
+            return self.max_profile_age
+        return age
+
     def get_vehicle_details(self, vehicle_id):
-        match = re.search(r'_(\d{4})$', vehicle_id)
-        if not match:
+        # The returned dict is shared, callers must not modify it
+        index = self.catalog.index.get(vehicle_id)
+        if index is None:
             return None
-
-        purchase_year = int(match.group(1))
-
-        if vehicle_id in self.vehicle_details:
-            vehicle_data = self.vehicle_details[vehicle_id]
-            return {
-                'year': purchase_year,
-                'cost': vehicle_data['cost'],
-                'size': vehicle_data['size'],
-                'distance': vehicle_data['distance'],
-                'yearly range': vehicle_data['yearly range']
-            }
-        return None
+        return self.catalog.details[index]
 
     def get_resale_value(self, purchase_cost, age):
-        if age == 0:
-            age_key = '1'
-        elif str(age) in self.resale_percentages:
-            age_key = str(age)
-        else:
-            age_key = max(self.resale_percentages.keys())
-        return (purchase_cost * self.resale_percentages[age_key]) + purchase_cost
+        return (purchase_cost * self.resale_by_age[self.age_index(age)]) + purchase_cost
 
     def get_insurance_cost(self, purchase_cost, age):
-        if age == 0:
-            age_key = '1'
-        elif str(age) in self.insurance_percentages:
-            age_key = str(age)
-        else:
-            age_key = max(self.insurance_percentages.keys())
-        return (purchase_cost * self.insurance_percentages[age_key]) + purchase_cost
+        return (purchase_cost * self.insurance_by_age[self.age_index(age)]) + purchase_cost
 
     def get_maintenance_cost(self, purchase_cost, age):
-        if age == 0:
-            age_key = '1'
-        elif str(age) in self.maintenance_percentages:
-            age_key = str(age)
-        else:
-            age_key = max(self.maintenance_percentages.keys())
-        return (purchase_cost * self.maintenance_percentages[age_key]) + purchase_cost
+        return (purchase_cost * self.maintenance_by_age[self.age_index(age)]) + purchase_cost
 
     def calculate_buy_cost(self, individual):
+        catalog = self.catalog
         total_cost = 0
         for vehicle in individual['buy']:
-            vehicle_id = vehicle['ID']
-            num_vehicles = vehicle['Num_Vehicles']
-            vehicle_details = self.get_vehicle_details(vehicle_id)
-            if vehicle_details:
-                purchase_cost = float(vehicle_details['cost'])
-                total_cost += purchase_cost * num_vehicles
+            index = catalog.index.get(vehicle['ID'])
+            if index is not None:
+                total_cost += catalog.cost[index] * vehicle['Num_Vehicles']
 
         return total_cost
 
     def calculate_costs(self, individual, current_year, cost_type):
+        if cost_type == 'insurance':
+            table = self.insurance_costs
+        elif cost_type == 'maintenance':
+            table = self.maintenance_costs
+
+        catalog = self.catalog
         total_cost = 0
         for vehicle in individual['use']:
-            vehicle_id = vehicle['ID']
-            num_vehicles = vehicle['Num_Vehicles']
-            vehicle_details = self.get_vehicle_details(vehicle_id)
-            if vehicle_details:
-                purchase_year = int(vehicle_details['year'])
-                purchase_cost = float(vehicle_details['cost'])
-                age = current_year - purchase_year
-
-                if cost_type == 'insurance':
-                    cost = self.get_insurance_cost(purchase_cost, age)
-                elif cost_type == 'maintenance':
-                    cost = self.get_maintenance_cost(purchase_cost, age)
-
-                total_cost += cost * num_vehicles
+            index = catalog.index.get(vehicle['ID'])
+            if index is not None:
+                age = self.age_index(current_year - catalog.year[index])
+                total_cost += table[index][age] * vehicle['Num_Vehicles']
 
         return total_cost
 
@@ -134,82 +566,62 @@ class FleetOptimization:
         return self.calculate_costs(individual, current_year, 'maintenance')
 
     def calculate_resale_value(self, individual, current_year):
+        catalog = self.catalog
         total_resale_value = 0
         for vehicle in individual['sell']:
-            vehicle_id = vehicle['ID']
-            num_vehicles_to_sell = vehicle['Num_Vehicles']
-            vehicle_details = self.get_vehicle_details(vehicle_id)
-            if vehicle_details:
-                purchase_year = int(vehicle_details['year'])
-                purchase_cost = float(vehicle_details['cost'])
-                resale_value = self.get_resale_value(
-                    purchase_cost, current_year - purchase_year)
-                total_resale_value += resale_value * num_vehicles_to_sell
+            index = catalog.index.get(vehicle['ID'])
+            if index is not None:
+                age = self.age_index(current_year - catalog.year[index])
+                total_resale_value += self.resale_values[index][age] * \
+                    vehicle['Num_Vehicles']
 
         return total_resale_value
 
     def calculate_emissions(self, individual):
+        catalog = self.catalog
         total_emissions = 0
         for vehicle in individual['use']:
-            vehicle_info = self.get_vehicle_details(vehicle['ID'])
-            current_year = vehicle_info['year']
-            vehicle_id = vehicle['ID']
-            num_vehicles = vehicle['Num_Vehicles']
-            distance_per_vehicle = vehicle['Distance_per_vehicle(km)']
+            index = catalog.index[vehicle['ID']]
             fuel_type = vehicle['Fuel']
 
-            fuel_consumption = self.vehicle_fuel_consumptions[vehicle_id][fuel_type]
-            fuel_emission = self.fuels_data[fuel_type][str(
-                current_year)]["Emissions (CO2/unit_fuel)"]
+            fuel_consumption = catalog.fuel_consumptions[index][fuel_type]
+            fuel_emission = self.fuel_emission_factors[index][fuel_type]
 
-            emissions = num_vehicles * distance_per_vehicle * fuel_consumption * fuel_emission
+            emissions = vehicle['Num_Vehicles'] * vehicle['Distance_per_vehicle(km)'] * \
+                fuel_consumption * fuel_emission
             total_emissions += emissions
 
         return total_emissions
 
     def calculate_fuel_cost(self, individual):
+        catalog = self.catalog
         total_cost = 0
         for vehicle in individual['use']:
-            vehicle_info = self.get_vehicle_details(vehicle['ID'])
-            vehicle_id = vehicle['ID']
-            current_year = vehicle_info['year']
-            num_vehicles = vehicle['Num_Vehicles']
-            distance_covered = vehicle['Distance_per_vehicle(km)']
+            index = catalog.index[vehicle['ID']]
             fuel_type = vehicle['Fuel']
 
-            fuel_consumption = self.vehicle_fuel_consumptions[vehicle_id][fuel_type]
-            fuel_cost_per_unit = self.fuels_data[fuel_type][str(
-                current_year)]['Cost ($/unit_fuel)']
+            fuel_consumption = catalog.fuel_consumptions[index][fuel_type]
+            fuel_cost_per_unit = self.fuel_unit_costs[index][fuel_type]
 
-            total_cost += float(distance_covered * num_vehicles *
+            total_cost += float(vehicle['Distance_per_vehicle(km)'] * vehicle['Num_Vehicles'] *
                                 fuel_consumption * fuel_cost_per_unit)
         return total_cost
 
     def update_existing_fleet(self, year, action, vehicle_id, num_vehicles):
-        existing_vehicle = next(
-            (v for v in self.existing_fleet if v['ID'] == vehicle_id), None)
+        fleet = self.existing_fleet
 
         if action == 'buy':
-            if existing_vehicle:
-                existing_vehicle['Num_Vehicles'] += num_vehicles
-            else:
-                self.existing_fleet.append({
-                    'ID': vehicle_id,
-                    'Num_Vehicles': num_vehicles,
-                    'Purchase_Year': year
-                })
+            fleet.add(vehicle_id, num_vehicles, year)
 
         elif action == 'sell':
-            if existing_vehicle:
-                existing_vehicle['Num_Vehicles'] -= num_vehicles
-                if existing_vehicle['Num_Vehicles'] <= 0:
-                    self.existing_fleet.remove(existing_vehicle)
+            if vehicle_id in fleet:
+                fleet.remove(vehicle_id, num_vehicles)
             else:
                 raise ValueError(
                     f"Cannot sell vehicle {vehicle_id} that is not in the fleet.")
 
         elif action == 'use':
-            if not existing_vehicle:
+            if vehicle_id not in fleet:
                 raise ValueError(
                     f"Cannot use vehicle {vehicle_id} that is not in the fleet.")
 
@@ -217,30 +629,18 @@ class FleetOptimization:
             raise ValueError(
                 f"Invalid action: {action}. Must be 'buy', 'sell', or 'use'.")
 
-        self.existing_fleet = [v for v in self.existing_fleet
-                               if (year - v['Purchase_Year']) < 10]
-
-    def check_fleet_meets_demand(self, individual):
-        total_distance_demand = self.yearly_demand
-        total_distance = 0
-
-        for vehicle in individual['use']:
-            vehicle_id = vehicle['ID']
-            num_vehicles = vehicle['Num_Vehicles']
-            distance_per_vehicle = vehicle['Distance_per_vehicle(km)']
-            vehicle_info = self.get_vehicle_details(vehicle_id)
+        fleet.retire(year, self.max_vehicle_age)
 
-            size = vehicle_info['size']
-            current_year = vehicle_info['year']
-            distance_bucket = vehicle['Distance_bucket']
-            demand = total_distance_demand[str(
-                current_year)][size][distance_bucket]
-            total_distance += num_vehicles * distance_per_vehicle
+    def check_fleet_meets_demand(self, individual, current_year):
+        return not self.demand_shortfall(individual, current_year)
 
-            if total_distance > demand:
-                return True
-
-        return False
+    def demand_shortfall(self, individual, current_year):
+        # Cells whose demand in the operating year is not covered by eligible
+        # vehicles, mapped to the missing km
+        demand_index = self.demand_index
+        shortfall = demand_index.shortfall(
+            demand_index.coverage(individual, current_year), current_year)
+        return demand_index.short_cells(shortfall)
 
     def buy_vehicles(self, year, vehicle_id, num_vehicles):
         vehicle_details = self.get_vehicle_details(vehicle_id)
@@ -257,15 +657,14 @@ class FleetOptimization:
         return purchase_cost
 
     def sell_vehicles(self, year, vehicle_id, num_vehicles):
-        existing_vehicle = next(
-            (v for v in self.existing_fleet if v['ID'] == vehicle_id), None)
+        existing_vehicle = self.existing_fleet.get(vehicle_id)
         if not existing_vehicle:
             raise ValueError(
                 f"Cannot sell vehicle {vehicle_id} that is not in the fleet.")
         if num_vehicles > existing_vehicle['Num_Vehicles']:
             raise ValueError(
                 f"Cannot sell {num_vehicles} of vehicle {vehicle_id}. Only {existing_vehicle['Num_Vehicles']} available.")
-        total_fleet_size = sum(v['Num_Vehicles'] for v in self.existing_fleet)
+        total_fleet_size = self.existing_fleet.total_vehicles
         if num_vehicles > total_fleet_size * self.max_sell_percentage:
             raise ValueError(
                 f"Cannot sell more than {self.max_sell_percentage * 100}% of the fleet in a year.")
@@ -280,8 +679,7 @@ class FleetOptimization:
         return resale_value
 
     def use_vehicles(self, year, vehicle_id, num_vehicles, distance_per_vehicle, fuel_type, distance_bucket):
-        existing_vehicle = next(
-            (v for v in self.existing_fleet if v['ID'] == vehicle_id), None)
+        existing_vehicle = self.existing_fleet.get(vehicle_id)
         if not existing_vehicle:
             raise ValueError(
                 f"Cannot use vehicle {vehicle_id} that is not in the fleet.")
@@ -297,7 +695,7 @@ class FleetOptimization:
             raise ValueError(
                 f"Distance per vehicle ({distance_per_vehicle}) exceeds yearly range ({vehicle_details['yearly range']})")
 
-        fuel_consumption = self.vehicle_fuel_consumptions[vehicle_id][fuel_type]
+        fuel_consumption = self.catalog.fuel_consumptions[self.catalog.index[vehicle_id]][fuel_type]
         fuel_cost_per_unit = self.fuels_data[fuel_type][str(
             year)]['Cost ($/unit_fuel)']
         total_fuel_cost = num_vehicles * distance_per_vehicle * \
@@ -309,4 +707,203 @@ class FleetOptimization:
             fuel_consumption * fuel_emission
 
         self.update_existing_fleet(year, 'use', vehicle_id, num_vehicles)
-        return total_fuel_cost, total_emissions
\ No newline at end of file
+        return total_fuel_cost, total_emissions
+
+    def constraint_penalty(self, violation_totals):
+        return sum(self.hard_constraint_penalty * self.constraint_weights.get(constraint, 1) * amount
+                   for constraint, amount in violation_totals.items())
+
+    def simulate_plan(self, plan, stop_at_first_violation=True):
+        # Replays a whole plan (a list of per-year {'buy', 'sell', 'use'}
+        # dicts or YearPlans) against a fresh fleet state, enforcing every
+        # rule of buy_vehicles, sell_vehicles and use_vehicles plus the
+        # carbon cap and demand. Within a year vehicles are bought, then
+        # sold, then used. The model's own existing_fleet is not touched.
+        catalog = self.catalog
+        distance_levels = self.distance_levels
+        fleet = FleetState()
+        year_results = []
+        violations = []
+
+        def violation(year, constraint, amount, message, vehicle_id=None):
+            violations.append({
+                'year': year,
+                'constraint': constraint,
+                'vehicle': vehicle_id,
+                'amount': amount,
+                'message': message
+            })
+            return stop_at_first_violation
+
+        def result():
+            counts = {}
+            for v in violations:
+                counts[v['year']] = counts.get(v['year'], 0) + 1
+            for y in year_results:
+                y['cost'] = y['buy_cost'] + y['insurance_cost'] + y['maintenance_cost'] + \
+                    y['fuel_cost'] - y['resale_value']
+                y['violations'] = counts.get(y['year'], 0)
+            violation_totals = {}
+            for v in violations:
+                violation_totals[v['constraint']] = violation_totals.get(
+                    v['constraint'], 0) + v['amount']
+            return {
+                'feasible': not violations,
+                'total_cost': sum(y['cost'] for y in year_results),
+                'total_emissions': sum(y['emissions'] for y in year_results),
+                'years': year_results,
+                'violations': violations,
+                'violation_totals': violation_totals
+            }
+
+        for year, year_dict in enumerate(plan, start=self.years[0]):
+            year_key = str(year)
+            fleet.retire(year, self.max_vehicle_age)
+            year_result = {
+                'year': year,
+                'buy_cost': 0.0,
+                'insurance_cost': 0.0,
+                'maintenance_cost': 0.0,
+                'fuel_cost': 0.0,
+                'resale_value': 0.0,
+                'cost': 0.0,
+                'emissions': 0.0,
+                'violations': 0
+            }
+            year_results.append(year_result)
+
+            for vehicle in year_dict['buy']:
+                vehicle_id = vehicle['ID']
+                num_vehicles = vehicle['Num_Vehicles']
+                index = catalog.index.get(vehicle_id)
+                if index is None:
+                    if violation(year, 'invalid_vehicle', num_vehicles,
+                                 f"Invalid vehicle ID: {vehicle_id}", vehicle_id):
+                        return result()
+                    continue
+                if catalog.year[index] != year:
+                    if violation(year, 'buy_year', num_vehicles,
+                                 f"Vehicle {vehicle_id} can only be bought in year {catalog.year[index]}",
+                                 vehicle_id):
+                        return result()
+                    continue
+                year_result['buy_cost'] += catalog.cost[index] * num_vehicles
+                fleet.add(vehicle_id, num_vehicles, year)
+
+            # The sell cap applies to all sales of the year together
+            sell_limit = fleet.total_vehicles * self.max_sell_percentage
+            sold = 0
+            for vehicle in year_dict['sell']:
+                vehicle_id = vehicle['ID']
+                num_vehicles = vehicle['Num_Vehicles']
+                holding = fleet.get(vehicle_id)
+                if holding is None:
+                    if violation(year, 'not_owned', num_vehicles,
+                                 f"Cannot sell vehicle {vehicle_id} that is not in the fleet.",
+                                 vehicle_id):
+                        return result()
+                    continue
+                if num_vehicles > holding['Num_Vehicles']:
+                    if violation(year, 'insufficient_vehicles', num_vehicles - holding['Num_Vehicles'],
+                                 f"Cannot sell {num_vehicles} of vehicle {vehicle_id}. Only {holding['Num_Vehicles']} available.",
+                                 vehicle_id):
+                        return result()
+                    num_vehicles = holding['Num_Vehicles']
+                if sold + num_vehicles > sell_limit:
+                    if violation(year, 'sell_cap', sold + num_vehicles - max(sell_limit, sold),
+                                 f"Cannot sell more than {self.max_sell_percentage * 100}% of the fleet in a year.",
+                                 vehicle_id):
+                        return result()
+                sold += num_vehicles
+                index = catalog.index[vehicle_id]
+                age = self.age_index(year - holding['Purchase_Year'])
+                year_result['resale_value'] += self.resale_values[index][age] * \
+                    num_vehicles
+                fleet.remove(vehicle_id, num_vehicles)
+
+            used = {}
+            covered = [0.0] * len(self.demand_index.cells)
+            for vehicle in year_dict['use']:
+                vehicle_id = vehicle['ID']
+                num_vehicles = vehicle['Num_Vehicles']
+                distance_per_vehicle = vehicle['Distance_per_vehicle(km)']
+                distance_bucket = vehicle.get('Distance_bucket')
+                fuel_type = vehicle['Fuel']
+                holding = fleet.get(vehicle_id)
+                if holding is None:
+                    if violation(year, 'not_owned', num_vehicles,
+                                 f"Cannot use vehicle {vehicle_id} that is not in the fleet.",
+                                 vehicle_id):
+                        return result()
+                    continue
+
+                # A vehicle may appear in several use entries (fuels or
+                # buckets), together they cannot exceed what is owned
+                total_used = used.get(vehicle_id, 0) + num_vehicles
+                used[vehicle_id] = total_used
+                if total_used > holding['Num_Vehicles']:
+                    if violation(year, 'insufficient_vehicles', total_used - holding['Num_Vehicles'],
+                                 f"Cannot use {total_used} of vehicle {vehicle_id}. Only {holding['Num_Vehicles']} available.",
+                                 vehicle_id):
+                        return result()
+
+                index = catalog.index[vehicle_id]
+                bucket_level = distance_levels.get(distance_bucket)
+                if bucket_level is None:
+                    if violation(year, 'distance_bucket', num_vehicles,
+                                 f"Vehicle {vehicle_id} is used in unknown distance bucket {distance_bucket}",
+                                 vehicle_id):
+                        return result()
+                    continue
+                if distance_levels[catalog.distance[index]] < bucket_level:
+                    if violation(year, 'distance_bucket', num_vehicles,
+                                 f"Vehicle {vehicle_id} cannot cover distance bucket {distance_bucket}",
+                                 vehicle_id):
+                        return result()
+                if distance_per_vehicle > catalog.yearly_range[index]:
+                    if violation(year, 'yearly_range',
+                                 (distance_per_vehicle -
+                                  catalog.yearly_range[index]) * num_vehicles,
+                                 f"Distance per vehicle ({distance_per_vehicle}) exceeds yearly range ({catalog.yearly_range[index]})",
+                                 vehicle_id):
+                        return result()
+
+                fuel_consumption = catalog.fuel_consumptions[index].get(
+                    fuel_type)
+                if fuel_consumption is None:
+                    if violation(year, 'fuel', num_vehicles,
+                                 f"Vehicle {vehicle_id} cannot run on {fuel_type}", vehicle_id):
+                        return result()
+                    continue
+
+                age = self.age_index(year - holding['Purchase_Year'])
+                year_result['insurance_cost'] += self.insurance_costs[index][age] * \
+                    num_vehicles
+                year_result['maintenance_cost'] += self.maintenance_costs[index][age] * \
+                    num_vehicles
+
+                fuel_year = self.fuels_data[fuel_type][year_key]
+                fuel_used = num_vehicles * distance_per_vehicle * fuel_consumption
+                year_result['fuel_cost'] += fuel_used * \
+                    fuel_year['Cost ($/unit_fuel)']
+                year_result['emissions'] += fuel_used * \
+                    fuel_year['Emissions (CO2/unit_fuel)']
+
+                cell = self.demand_index.cell_index.get(
+                    (catalog.size[index], distance_bucket))
+                if cell is not None:
+                    covered[cell] += num_vehicles * distance_per_vehicle
+
+            carbon_limit = self.carbon_emissions[year_key]
+            if year_result['emissions'] > carbon_limit:
+                if violation(year, 'emissions', year_result['emissions'] - carbon_limit,
+                             f"Emissions ({year_result['emissions']}) exceed the limit ({carbon_limit})"):
+                    return result()
+
+            shortfall = self.demand_index.shortfall(np.array(covered), year)
+            for (size, distance_bucket), missing in self.demand_index.short_cells(shortfall).items():
+                if violation(year, 'demand', missing,
+                             f"Demand for {size} {distance_bucket} is short by {missing} km"):
+                    return result()
+
+        return result()
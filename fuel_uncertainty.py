@@ -0,0 +1,107 @@
+import numpy as np
+from fleet_decarbonization_model import FleetOptimization
+
+
+class FuelPriceScenarios:
+    # Sampled fuel prices for every (scenario, operating year, fuel). Each
+    # price is drawn uniformly within the dataset's 'Cost Uncertainty (±%)'
+    # band around the point price 'Cost ($/unit_fuel)'.
+    def __init__(self, fleet_optimization, num_scenarios=10000, seed=0):
+        fo = fleet_optimization
+        self.fleet_optimization = fo
+        self.years = list(fo.years)
+        self.fuels = list(fo.fuels_data)
+        self.fuel_index = {fuel: f for f, fuel in enumerate(self.fuels)}
+        self.num_scenarios = num_scenarios
+        self.seed = seed
+
+        self.point_prices = np.array(
+            [[fo.fuels_data[fuel][str(year)]['Cost ($/unit_fuel)'] for fuel in self.fuels]
+             for year in self.years])
+        self.uncertainty = np.array(
+            [[fo.fuels_data[fuel][str(year)]['Cost Uncertainty (±%)'] for fuel in self.fuels]
+             for year in self.years]) / 100
+        rng = np.random.default_rng(seed)
+        self.prices = self.point_prices * \
+            (1 + self.uncertainty * rng.uniform(-1, 1,
+             size=(num_scenarios,) + self.point_prices.shape))
+
+        # Fuel units per km of every catalog vehicle, (vehicle, fuel)
+        catalog = fo.catalog
+        self.consumption = np.zeros((len(catalog), len(self.fuels)))
+        for index, consumptions in enumerate(catalog.fuel_consumptions):
+            for fuel, consumption in consumptions.items():
+                self.consumption[index, self.fuel_index[fuel]] = consumption
+
+    def fuel_units(self, plan):
+        # Fuel used per (operating year, fuel)
+        catalog = self.fleet_optimization.catalog
+        units = np.zeros(self.point_prices.shape)
+        for y, year_dict in enumerate(plan):
+            for vehicle in year_dict['use']:
+                index = catalog.index.get(vehicle['ID'])
+                fuel = self.fuel_index.get(vehicle['Fuel'])
+                if index is None or fuel is None:
+                    continue
+                units[y, fuel] += vehicle['Num_Vehicles'] * vehicle['Distance_per_vehicle(km)'] * \
+                    self.consumption[index, fuel]
+        return units
+
+    def scenario_costs(self, plans):
+        # (scenario, plan) total costs: each plan's simulate_plan cost with
+        # its fuel repriced in every scenario, as one array product
+        fixed_costs = []
+        feasible = []
+        for plan in plans:
+            result = self.fleet_optimization.simulate_plan(
+                plan, stop_at_first_violation=False)
+            fixed_costs.append(result['total_cost'] -
+                               sum(year['fuel_cost'] for year in result['years']))
+            feasible.append(result['feasible'])
+        units = np.array([self.fuel_units(plan) for plan in plans]).reshape(
+            (len(plans),) + self.point_prices.shape)
+        costs = np.einsum('syf,pyf->sp', self.prices, units) + \
+            np.array(fixed_costs)
+        return costs, np.array(feasible, dtype=bool)
+
+    def evaluate(self, plans, alpha=0.95, percentiles=(5, 50, 95)):
+        costs, feasible = self.scenario_costs(plans)
+        summary = risk_summary(costs, alpha, percentiles)
+        summary['feasible'] = feasible
+        return summary
+
+    def evaluate_plan(self, plan, alpha=0.95, percentiles=(5, 50, 95)):
+        summary = self.evaluate([plan], alpha, percentiles)
+        return {key: (value[0].item() if key != 'percentiles' else
+                      {p: values[0].item() for p, values in value.items()})
+                for key, value in summary.items()}
+
+
+def risk_summary(costs, alpha=0.95, percentiles=(5, 50, 95)):
+    # Statistics over the scenario axis of a (scenario, plan) cost array.
+    # CVaR is the mean cost of the worst 1 - alpha share of the scenarios.
+    costs = np.sort(costs, axis=0)
+    tail = min(costs.shape[0] - 1, int(np.floor(alpha * costs.shape[0])))
+    return {
+        'expected_cost': costs.mean(axis=0),
+        'std_cost': costs.std(axis=0),
+        'var': costs[tail],
+        'cvar': costs[tail:].mean(axis=0),
+        'percentiles': {p: np.percentile(costs, p, axis=0) for p in percentiles}
+    }
+
+
+# Usage
+if __name__ == '__main__':
+    import random
+    from genetic_algorithm import GeneticAlgorithm
+    random.seed(33)
+    fleet_optimization = FleetOptimization(
+        'dataset/mapping_and_cost_data.bin')
+    ga = GeneticAlgorithm(fleet_optimization, population_size=20, generations=5,
+                          repair=True)
+    best_solution = ga.evolve()
+    scenarios = FuelPriceScenarios(fleet_optimization)
+    summary = scenarios.evaluate_plan(best_solution)
+    print(f"Expected Cost = {summary['expected_cost']}, CVaR 95% = {summary['cvar']}, "
+          f"Percentiles = {summary['percentiles']}")
@@ -1,145 +1,971 @@
+import cProfile
 import random
-import copy
+import math
+import time
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from checkpoint import read_checkpoint, write_checkpoint
+from chromosome import FleetEntry, YearPlan, freeze_chromosome, replace_entry
 from fleet_decarbonization_model import FleetOptimization
+from fuel_uncertainty import risk_summary
+from telemetry import PHASES, MetricsWriter
 import csv
 
 
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        # Evict the least recently used entries once the bound is exceeded
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def year_key(year_dict):
+    # Canonical, hashable form of a single year of a chromosome. Frozen
+    # years already are one and compare equal to the key of the same dict.
+    if isinstance(year_dict, YearPlan):
+        return year_dict
+    return tuple(
+        tuple((vehicle['ID'],
+               vehicle['Num_Vehicles'],
+               vehicle.get('Distance_per_vehicle(km)'),
+               vehicle.get('Distance_bucket'),
+               vehicle.get('Fuel'))
+              for vehicle in year_dict[action])
+        for action in ('buy', 'sell', 'use'))
+
+
+def chromosome_key(chromosome):
+    return tuple(year_key(year_dict) for year_dict in chromosome)
+
+
+def pick_new_vehicle(catalog, options, km, budget):
+    # The first of the ranked (cost, emissions, index, fuel) options whose
+    # vehicles cover km within the emissions budget, else the cleanest one.
+    # Whole vehicles on whole km, so slightly over km. Returns the option,
+    # the number of vehicles and the distance per vehicle.
+    for option in options:
+        yearly_range = catalog.yearly_range[option[2]]
+        num_vehicles = math.ceil(km / yearly_range)
+        distance = min(yearly_range, math.ceil(km / num_vehicles))
+        if option[1] * num_vehicles * distance <= budget:
+            return option, num_vehicles, distance
+    option = min(options, key=lambda option: option[1])
+    yearly_range = catalog.yearly_range[option[2]]
+    num_vehicles = math.ceil(km / yearly_range)
+    return option, num_vehicles, min(yearly_range, math.ceil(km / num_vehicles))
+
+
+# Per-process state of pool workers, set up once by _init_worker
+_worker_algorithm = None
+
+
+def _init_worker(fleet_optimization, options, algorithm_class=None):
+    global _worker_algorithm
+    _worker_algorithm = (algorithm_class or GeneticAlgorithm)(
+        fleet_optimization, **options)
+
+
+def _evaluate_chunk(chunk):
+    return _worker_algorithm.evaluate_population(chunk)
+
+
 class GeneticAlgorithm:
-    def __init__(self, fleet_optimization, population_size=100, generations=650):
+    def __init__(self, fleet_optimization, population_size=100, generations=650,
+                 fitness_cache_size=10000, year_cache_size=50000, vectorized=False,
+                 workers=None, chunk_size=None, fitness_mode='standard', repair=False,
+                 seeding='random', seed_noise=0.3, seed_variants=32,
+                 elite_size=0, stall_generations=None, stall_tolerance=0.0,
+                 time_limit=None, target_fitness=None, checkpoint_path=None,
+                 checkpoint_interval=10, callbacks=None, metrics_path=None,
+                 violation_metrics=False, profile_path=None, fuel_scenarios=None,
+                 risk_measure='cvar'):
         # Set the seed for reproducibility
 
         self.fleet_optimization = fleet_optimization
         self.population_size = population_size
         self.generations = generations
         self.population = []
+        # Fitness of each chromosome of the population, in the same order
+        self.scores = None
+
+        # The elite_size best chromosomes are carried into the next
+        # generation unchanged
+        if not 0 <= elite_size < population_size:
+            raise ValueError(
+                f"Invalid elite size: {elite_size}. Must be at least 0 and less than the population size.")
+        self.elite_size = elite_size
+
+        # evolve stops at the first of: the generation budget, stall_generations
+        # generations without improving the best fitness by more than
+        # stall_tolerance, time_limit seconds, or reaching target_fitness
+        self.stall_generations = stall_generations
+        self.stall_tolerance = stall_tolerance
+        self.time_limit = time_limit
+        self.target_fitness = target_fitness
+        self.generation = 0
+        self.best_chromosome = None
+        self.best_fitness = float('inf')
+        self.stalled_generations = 0
+        self.stop_reason = None
+        # Seconds spent in earlier runs of a resumed optimisation
+        self.elapsed_before = 0.0
+
+        # Every checkpoint_interval generations, and when evolve stops, the
+        # run is saved to checkpoint_path so resume() can continue it
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+
+        # Called as callback(ga, record) after every generation; a callback
+        # returning True stops the run. metrics_path streams the records to
+        # a .jsonl or .csv file. Records carry the population's violation
+        # totals, as the fitness mode checks them, in penalty and simulate
+        # mode; violation_metrics adds them in the other modes, at the cost
+        # of extra checks every generation.
+        self.callbacks = list(callbacks or [])
+        self.metrics_path = metrics_path
+        self.violation_metrics = violation_metrics
+        # Seconds spent in each phase of the current generation
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        # cProfile the generation loop and dump the stats to profile_path
+        self.profile_path = profile_path
+
+        # Fitness values keyed by chromosome content, so unchanged children
+        # and repeated tournament entrants are never re-scored
+        self.fitness_cache = LRUCache(fitness_cache_size)
+        # Per-year (cost, emissions, feasible) results keyed by (year, content)
+        self.year_cache = LRUCache(year_cache_size)
+
+        # 'standard' sums the per-year calculate_* results, 'simulate' replays
+        # the whole plan through FleetOptimization.simulate_plan and 'penalty'
+        # replays it without stopping, adding a penalty for every violation
+        # instead of scoring infeasible plans as inf. 'robust' scores feasible
+        # plans by the risk_measure ('expected_cost' or 'cvar') of their cost
+        # over the fuel_scenarios (a FuelPriceScenarios).
+        if fitness_mode not in ('standard', 'simulate', 'penalty', 'robust'):
+            raise ValueError(
+                f"Invalid fitness mode: {fitness_mode}. Must be 'standard', 'simulate', 'penalty' or 'robust'.")
+        if fitness_mode == 'robust' and fuel_scenarios is None:
+            raise ValueError("The 'robust' fitness mode needs fuel_scenarios.")
+        if risk_measure not in ('expected_cost', 'cvar'):
+            raise ValueError(
+                f"Invalid risk measure: {risk_measure}. Must be 'expected_cost' or 'cvar'.")
+        self.fitness_mode = fitness_mode
+        self.fuel_scenarios = fuel_scenarios
+        self.risk_measure = risk_measure
+        # Per-constraint violation totals keyed by chromosome content
+        self.violation_cache = LRUCache(fitness_cache_size)
+
+        # Repair the initial population and every child before evaluation
+        self.repair_children = repair
+
+        # 'random' draws the initial population at random, 'greedy' builds it
+        # with seed_chromosome, taking a costlier option with seed_noise
+        # probability for diversity. Each demand cell gets seed_variants
+        # greedy variants, built on the first seed.
+        if seeding not in ('random', 'greedy'):
+            raise ValueError(
+                f"Invalid seeding: {seeding}. Must be 'random' or 'greedy'.")
+        self.seeding = seeding
+        self.seed_noise = seed_noise
+        self.seed_variants = seed_variants
+        self.cell_variants = None
+
+        # Optionally score whole generations at once with NumPy
+        self.batch_evaluator = None
+        if vectorized and fitness_mode == 'standard':
+            from batch_evaluation import BatchEvaluator
+            self.batch_evaluator = BatchEvaluator(fleet_optimization)
+
+        # Optionally score children across a process pool. The model is
+        # shipped to each worker once, when the pool starts.
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pool = None
+
+    def seed_cell(self, c, allowances):
+        # Builds one demand cell's part of a plan, year by year, from the
+        # precomputed rankings: the cell is served first by vehicles bought
+        # for it earlier and still in service, then by buying the cheapest
+        # option per km of the year. Emissions must stay within the cell's
+        # allowance while leaving room to serve the rest of it with the
+        # cleanest new vehicles, so dirtier owned vehicles are left idle and
+        # dirtier options skipped once the allowance gets tight.
+        fo = self.fleet_optimization
+        catalog = fo.catalog
+        demand_index = fo.demand_index
+        noise = self.seed_noise
+        bucket = demand_index.cells[c][1]
+
+        # [index, fuel, count, purchase year, emissions per km, cleanest
+        # fuel, its emissions per km] of the vehicles bought for the cell
+        holdings = []
+        years = []
+        for y, year in enumerate(fo.years):
+            missing = int(demand_index.required[y][c])
+            buy, use = [], []
+            if missing <= 0:
+                years.append(((), ()))
+                continue
+            cleanest = float(fo.cleanest_new_emissions[y][c])
+            budget = allowances[y][c]
+            eligible = demand_index.eligible[y][c]
+
+            if holdings and year - holdings[0][3] >= fo.max_vehicle_age:
+                holdings[:] = [holding for holding in holdings
+                               if year - holding[3] < fo.max_vehicle_age]
+            for index, fuel, count, _, emissions, clean_fuel, clean_emissions in holdings:
+                vehicle_id = catalog.ids[index]
+                if vehicle_id not in eligible:
+                    continue
+                yearly_range = catalog.yearly_range[index]
+                num_vehicles = min(count, math.ceil(missing / yearly_range))
+                distance = min(yearly_range, math.ceil(missing / num_vehicles))
+                km = num_vehicles * distance
+                # Whatever they leave uncovered still needs new vehicles
+                room = budget - cleanest * max(0, missing - km)
+                if emissions * km > room:
+                    if clean_emissions * km > room:
+                        continue
+                    fuel, emissions = clean_fuel, clean_emissions
+                use.append(FleetEntry(
+                    vehicle_id, num_vehicles, distance, bucket, fuel))
+                budget -= emissions * km
+                missing -= km
+                if missing <= 0:
+                    break
+
+            # Buy the rest, cheapest first unless noise or the allowance
+            # says otherwise
+            ranked = fo.new_vehicle_options[y][c]
+            if missing > 0 and ranked:
+                if noise and random.random() < noise:
+                    ranked = ranked[random.randrange(
+                        min(3, len(ranked))):] + ranked
+                choice, num_vehicles, distance = pick_new_vehicle(
+                    catalog, ranked, missing, budget)
+                _, emissions, index, fuel = choice
+                vehicle_id = catalog.ids[index]
+                buy.append(FleetEntry(vehicle_id, num_vehicles,
+                                      catalog.yearly_range[index], bucket, fuel))
+                use.append(FleetEntry(vehicle_id, num_vehicles,
+                                      distance, bucket, fuel))
+                clean_emissions, _, clean_fuel = fo.fuel_options[y][index][0]
+                holdings.append([index, fuel, num_vehicles, year, emissions,
+                                 clean_fuel, clean_emissions])
+            years.append((tuple(buy), tuple(use)))
+        return years
+
+    def seed_allowances(self):
+        # Each cell may emit what serving it with the cleanest new vehicles
+        # would, plus a share of the rest of the year's cap in proportion to
+        # its demand. The cells then never compete for the cap, so any mix of
+        # their variants stays within it.
+        fo = self.fleet_optimization
+        allowances = []
+        for y, year in enumerate(fo.years):
+            required = np.maximum(fo.demand_index.required[y], 0)
+            floor = fo.cleanest_new_emissions[y] * required
+            slack = fo.carbon_emissions[str(year)] - floor.sum()
+            share = required / required.sum() if required.sum() else required
+            allowances.append((floor + slack * share).tolist())
+        return allowances
+
+    def seed_chromosome(self):
+        # A greedy plan made of one precomputed variant per demand cell.
+        # Cells only share the carbon cap, which seed_allowances splits
+        # between them, so their variants combine freely; building them once
+        # keeps seeding a population of thousands cheap. Without noise every
+        # variant, and so every seed, is the same greedy plan.
+        if self.cell_variants is None:
+            allowances = self.seed_allowances()
+            count = self.seed_variants if self.seed_noise else 1
+            self.cell_variants = [
+                [self.seed_cell(c, allowances) for _ in range(count)]
+                for c in range(len(self.fleet_optimization.demand_index.cells))]
+
+        picks = [random.choice(variants) for variants in self.cell_variants]
+        chromosome = []
+        for y in range(len(self.fleet_optimization.years)):
+            buy, use = [], []
+            for pick in picks:
+                cell_buy, cell_use = pick[y]
+                buy += cell_buy
+                use += cell_use
+            chromosome.append(YearPlan(tuple(buy), (), tuple(use)))
+        return tuple(chromosome)
 
     def generate_initial_population(self):
+        if self.seeding == 'greedy':
+            for _ in range(self.population_size):
+                chromosome = self.seed_chromosome()
+                if self.repair_children:
+                    chromosome = self.repair(chromosome)
+                self.population.append(chromosome)
+            return
+
+        catalog = self.fleet_optimization.catalog
         for _ in range(self.population_size):
             chromosome = []
             for year in range(2023, 2039):
-                year_dict = {'buy': [], 'sell': [], 'use': []}
+                buy, sell = [], []
 
                 # Randomly decide to buy vehicles
-                for vehicle_id in self.fleet_optimization.vehicle_ids:
+                for index, vehicle_id in enumerate(catalog.ids):
                     if random.random() < 0.3:  # 30% chance to buy each vehicle type
-                        vehicle_details = self.fleet_optimization.get_vehicle_details(
-                            vehicle_id)
-                        if vehicle_details and vehicle_details['year'] == year:
+                        if catalog.year[index] == year:
                             num_vehicles = random.randint(1, 10)
-                            year_dict['buy'].append({
-                                'ID': vehicle_id,
-                                'Num_Vehicles': num_vehicles,
-                                'Distance_per_vehicle(km)': vehicle_details['yearly range'],
-                                'Distance_bucket': vehicle_details['distance'],
-                                'Fuel': random.choice(list(self.fleet_optimization.vehicle_fuel_consumptions[vehicle_id].keys()))
-                            })
+                            buy.append(FleetEntry(
+                                vehicle_id,
+                                num_vehicles,
+                                catalog.yearly_range[index],
+                                catalog.distance[index],
+                                random.choice(list(catalog.fuel_consumptions[index].keys()))))
 
                 # Randomly decide to sell vehicles (simplified)
                 if year > 2023 and random.random() < 0.2:  # 20% chance to sell
-                    for vehicle in chromosome[-1]['use']:
+                    for vehicle in chromosome[-1].use:
                         if random.random() < 0.1:  # 10% chance to sell each vehicle type
-                            year_dict['sell'].append({
-                                'ID': vehicle['ID'],
-                                'Num_Vehicles': random.randint(1, vehicle['Num_Vehicles']),
-                                'Distance_per_vehicle(km)': vehicle['Distance_per_vehicle(km)'],
-                                'Distance_bucket': vehicle['Distance_bucket'],
-                                'Fuel': vehicle['Fuel']
-                            })
-
-                # Use all vehicles that weren't sold
-                year_dict['use'] = copy.deepcopy(year_dict['buy'])
+                            sell.append(vehicle._replace(
+                                num_vehicles=random.randint(1, vehicle.num_vehicles)))
+
+                # Use all vehicles that weren't sold. Entries are immutable,
+                # so they are shared rather than copied.
+                use = list(buy)
                 if year > 2023:
-                    for vehicle in chromosome[-1]['use']:
-                        if not any(sell_vehicle['ID'] == vehicle['ID'] for sell_vehicle in year_dict['sell']):
-                            year_dict['use'].append(copy.deepcopy(vehicle))
+                    sold_ids = {vehicle.id for vehicle in sell}
+                    use.extend(vehicle for vehicle in chromosome[-1].use
+                               if vehicle.id not in sold_ids)
 
-                chromosome.append(year_dict)
+                chromosome.append(YearPlan(tuple(buy), tuple(sell), tuple(use)))
 
+            chromosome = tuple(chromosome)
+            if self.repair_children:
+                chromosome = self.repair(chromosome)
             self.population.append(chromosome)
 
     def fitness(self, chromosome):
+        year_keys = [year_key(year_dict) for year_dict in chromosome]
+        key = tuple(year_keys)
+        cached = self.fitness_cache.get(key)
+        if cached is not None:
+            return cached
+
+        value = self.calculate_fitness(chromosome, year_keys)
+        self.fitness_cache.put(key, value)
+        return value
+
+    def evaluate_population(self, population):
+        keys = [chromosome_key(chromosome) for chromosome in population]
+        scores = [self.fitness_cache.get(key) for key in keys]
+
+        # Score every cache miss, across the pool when one is configured and
+        # in a single batched call when vectorized
+        missing = [i for i, score in enumerate(scores) if score is None]
+        chromosomes = [population[i] for i in missing]
+        if self.workers and len(chromosomes) > 1:
+            new_scores = self.evaluate_in_pool(chromosomes)
+        elif self.batch_evaluator is not None:
+            new_scores = [float(score)
+                          for score in self.batch_evaluator.fitness(chromosomes)]
+        elif self.fitness_mode == 'robust' and chromosomes:
+            new_scores = self.robust_fitness(chromosomes)
+        else:
+            new_scores = [self.calculate_fitness(population[i], list(keys[i]))
+                          for i in missing]
+
+        for i, score in zip(missing, new_scores):
+            scores[i] = score
+            self.fitness_cache.put(keys[i], score)
+        return scores
+
+    def start_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.fleet_optimization, {
+                    'vectorized': self.batch_evaluator is not None,
+                    'fitness_mode': self.fitness_mode,
+                    'fuel_scenarios': self.fuel_scenarios,
+                    'risk_measure': self.risk_measure}, type(self)))
+        return self.pool
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def evaluate_in_pool(self, chromosomes):
+        chunk_size = self.chunk_size or max(
+            1, math.ceil(len(chromosomes) / (self.workers * 4)))
+        chunks = [chromosomes[i:i + chunk_size]
+                  for i in range(0, len(chromosomes), chunk_size)]
+
+        # map() returns results in submission order, so scores do not depend
+        # on which worker finishes first
+        scores = []
+        for chunk_scores in self.start_pool().map(_evaluate_chunk, chunks):
+            scores.extend(chunk_scores)
+        return scores
+
+    def robust_fitness(self, chromosomes):
+        # All chromosomes repriced over every fuel price scenario at once
+        costs, feasible = self.fuel_scenarios.scenario_costs(chromosomes)
+        risk = risk_summary(costs)[self.risk_measure]
+        return [float(value) if ok else float('inf') for value, ok in zip(risk, feasible)]
+
+    def calculate_fitness(self, chromosome, year_keys=None):
+        if self.fitness_mode == 'robust':
+            return self.robust_fitness([chromosome])[0]
+        if self.fitness_mode == 'simulate':
+            result = self.fleet_optimization.simulate_plan(chromosome)
+            key = tuple(year_keys) if year_keys is not None else chromosome_key(chromosome)
+            self.violation_cache.put(key, result['violation_totals'])
+            return result['total_cost'] if result['feasible'] else float('inf')
+        if self.fitness_mode == 'penalty':
+            result = self.fleet_optimization.simulate_plan(
+                chromosome, stop_at_first_violation=False)
+            key = tuple(year_keys) if year_keys is not None else chromosome_key(chromosome)
+            self.violation_cache.put(key, result['violation_totals'])
+            return result['total_cost'] + \
+                self.fleet_optimization.constraint_penalty(
+                    result['violation_totals'])
+
+        if year_keys is None:
+            year_keys = [year_key(year_dict) for year_dict in chromosome]
+
         total_cost = 0
-        total_emissions = 0
-        for year, year_dict in enumerate(chromosome, start=2023):
-            try:
-                # Calculate costs
-                total_cost += self.fleet_optimization.calculate_buy_cost(
-                    year_dict)
-                total_cost += self.fleet_optimization.calculate_insurance_cost(
-                    year_dict, year)
-                total_cost += self.fleet_optimization.calculate_maintenance_cost(
-                    year_dict, year)
-                total_cost += self.fleet_optimization.calculate_fuel_cost(
-                    year_dict)
-                total_cost -= self.fleet_optimization.calculate_resale_value(
-                    year_dict, year)
-
-                # Calculate emissions
-                year_emissions = self.fleet_optimization.calculate_emissions(
-                    year_dict)
-                total_emissions += year_emissions
-
-                # Check if emissions exceed the limit
-                if year_emissions > self.fleet_optimization.carbon_emissions[str(year)]:
-                    # Return a very high cost if emissions limit is exceeded
-                    return float('inf')
-
-                # Check if demand is met
-                if not self.fleet_optimization.check_fleet_meets_demand(year_dict):
-                    # Return a very high cost if demand is not met
-                    return float('inf')
-
-            except ValueError:
+        for year, (year_dict, key) in enumerate(zip(chromosome, year_keys), start=2023):
+            year_cost, _, feasible = self.evaluate_year(year, year_dict, key)
+            if not feasible:
                 # Return a very high cost if any constraint is violated
                 return float('inf')
+            total_cost += year_cost
 
         return total_cost
 
+    def violation_totals(self, chromosome):
+        # Violation amount per constraint, {} if feasible
+        key = chromosome_key(chromosome)
+        totals = self.violation_cache.get(key)
+        if totals is None:
+            totals = self.check_violations(chromosome)
+            self.violation_cache.put(key, totals)
+        return totals
+
+    def check_violations(self, chromosome):
+        # The violations the fitness mode itself checks: the whole plan in
+        # penalty and robust mode, up to the first violation in simulate
+        # mode, and the first year over its cap or short of demand in
+        # standard mode
+        if self.fitness_mode == 'standard':
+            return self.year_violations(chromosome)
+        return self.fleet_optimization.simulate_plan(
+            chromosome, stop_at_first_violation=self.fitness_mode == 'simulate')['violation_totals']
+
+    def year_violations(self, chromosome):
+        fo = self.fleet_optimization
+        for year, year_dict in enumerate(chromosome, start=2023):
+            _, emissions, feasible = self.evaluate_year(year, year_dict)
+            if feasible:
+                continue
+            cap = fo.carbon_emissions[str(year)]
+            if emissions > cap:
+                return {'emissions': emissions - cap}
+            return {'demand': sum(fo.demand_shortfall(year_dict, year).values())}
+        return {}
+
+    def population_violations(self, population=None):
+        # Summed violation totals and the number of feasible chromosomes, to
+        # track how a run converges towards feasibility
+        totals = {}
+        feasible = 0
+        for chromosome in self.population if population is None else population:
+            chromosome_totals = self.violation_totals(chromosome)
+            if not chromosome_totals:
+                feasible += 1
+            for constraint, amount in chromosome_totals.items():
+                totals[constraint] = totals.get(constraint, 0) + amount
+        return totals, feasible
+
+    def evaluate_year(self, year, year_dict, key=None):
+        # Years are shared between parents and children, so their sub-scores
+        # are cached and only changed years are recomputed
+        if key is None:
+            key = year_key(year_dict)
+        cached = self.year_cache.get((year, key))
+        if cached is not None:
+            return cached
+
+        result = self.calculate_year(year, year_dict)
+        self.year_cache.put((year, key), result)
+        return result
+
+    def calculate_year(self, year, year_dict):
+        year_cost = 0
+        year_emissions = 0
+        try:
+            # Calculate costs
+            year_cost += self.fleet_optimization.calculate_buy_cost(year_dict)
+            year_cost += self.fleet_optimization.calculate_insurance_cost(
+                year_dict, year)
+            year_cost += self.fleet_optimization.calculate_maintenance_cost(
+                year_dict, year)
+            year_cost += self.fleet_optimization.calculate_fuel_cost(year_dict)
+            year_cost -= self.fleet_optimization.calculate_resale_value(
+                year_dict, year)
+
+            # Calculate emissions
+            year_emissions = self.fleet_optimization.calculate_emissions(
+                year_dict)
+
+            # Check if emissions exceed the limit
+            if year_emissions > self.fleet_optimization.carbon_emissions[str(year)]:
+                return year_cost, year_emissions, False
+
+            # Check if demand is met
+            if not self.fleet_optimization.check_fleet_meets_demand(year_dict, year):
+                return year_cost, year_emissions, False
+
+        except ValueError:
+            return year_cost, year_emissions, False
+
+        return year_cost, year_emissions, True
+
+    def score_population(self):
+        # The only place a generation is scored; selection and reporting
+        # read the resulting array
+        self.scores = np.array(
+            self.evaluate_population(self.population), dtype=float)
+        return self.scores
+
+    def best_index(self):
+        return int(np.argmin(self.scores))
+
     def select_parents(self):
         tournament_size = 5
-        tournament = random.sample(self.population, tournament_size)
-        return min(tournament, key=self.fitness)
+        tournament = np.array(random.sample(
+            range(len(self.population)), tournament_size))
+        return self.population[tournament[np.argmin(self.scores[tournament])]]
 
     def crossover(self, parent1, parent2):
+        # Years are immutable, so the child shares them with its parents
         child = []
         for year in range(len(parent1)):
             if random.random() < 0.5:
-                child.append(copy.deepcopy(parent1[year]))
+                child.append(parent1[year])
             else:
-                child.append(copy.deepcopy(parent2[year]))
-        return child
+                child.append(parent2[year])
+        return freeze_chromosome(child)
 
     def mutate(self, chromosome):
-        for year_dict in chromosome:
+        # Copy-on-write: only the years that are touched get new records
+        mutated = list(freeze_chromosome(chromosome))
+        for year, year_plan in enumerate(mutated):
             if random.random() < 0.1:  # 10% chance to mutate each year
                 action = random.choice(['buy', 'sell', 'use'])
-                if year_dict[action]:
-                    vehicle = random.choice(year_dict[action])
-                    vehicle['Num_Vehicles'] = max(
-                        1, vehicle['Num_Vehicles'] + random.randint(-2, 2))
-        return chromosome
+                if year_plan[action]:
+                    position = random.randrange(len(year_plan[action]))
+                    vehicle = year_plan[action][position]
+                    vehicle = vehicle._replace(num_vehicles=max(
+                        1, vehicle.num_vehicles + random.randint(-2, 2)))
+                    mutated[year] = replace_entry(
+                        year_plan, action, position, vehicle)
+        return tuple(mutated)
+
+    def repair(self, chromosome):
+        # Turns an infeasible child into a (more) feasible one, year by year:
+        # drops use of vehicles past their age limit, clamps sells to the
+        # vehicles owned and the yearly sell cap, tops up short demand cells
+        # with the cheapest vehicles that can be bought that year and fit the
+        # carbon cap (used for the rest of their life), and while the cap is
+        # exceeded switches to cleaner fuels and then trims use that demand
+        # does not need. Unchanged years are shared as they are.
+        fo = self.fleet_optimization
+        catalog = fo.catalog
+        demand_index = fo.demand_index
+        cell_index = demand_index.cell_index
+        eligible = demand_index.eligible
+        chromosome = freeze_chromosome(chromosome)
+        start_year = fo.years[0]
+
+        owned = {}
+        carried = {}
+        repaired = []
+        for y, year_plan in enumerate(chromosome):
+            year = start_year + y
+            buy = list(year_plan.buy)
+            sell = list(year_plan.sell)
+            use = carried.pop(y, [])
+            changed = bool(use)
+
+            for vehicle in buy:
+                owned[vehicle.id] = owned.get(vehicle.id, 0) + \
+                    vehicle.num_vehicles
+            for vehicle_id in [v for v in owned if v not in catalog or
+                               year - catalog.year[catalog.index[v]] >= fo.max_vehicle_age]:
+                del owned[vehicle_id]
+
+            # Sells: at most what is owned and the sell cap over the year
+            sell_limit = int(sum(owned.values()) * fo.max_sell_percentage)
+            sold = 0
+            clamped = []
+            for vehicle in sell:
+                num_vehicles = min(vehicle.num_vehicles, owned.get(vehicle.id, 0),
+                                   sell_limit - sold)
+                if num_vehicles != vehicle.num_vehicles:
+                    changed = True
+                if num_vehicles > 0:
+                    clamped.append(vehicle._replace(num_vehicles=num_vehicles))
+                    owned[vehicle.id] -= num_vehicles
+                    sold += num_vehicles
+            sell = clamped
+
+            # Use: drop vehicles not yet bought or past their age limit
+            for vehicle in year_plan.use:
+                index = catalog.index.get(vehicle.id)
+                if index is not None and 0 <= year - catalog.year[index] < fo.max_vehicle_age:
+                    use.append(vehicle)
+                else:
+                    changed = True
+
+            # km per demand cell and emissions of the year's use, computed
+            # as DemandIndex.coverage and calculate_emissions do
+            covered = [0.0] * len(demand_index.cells)
+            emissions = 0
+            for vehicle in use:
+                index = catalog.index[vehicle.id]
+                km = vehicle.num_vehicles * vehicle.distance_per_vehicle
+                cell = cell_index.get((catalog.size[index], vehicle.distance_bucket))
+                if cell is not None and vehicle.id in eligible[y][cell]:
+                    covered[cell] += km
+                emissions += km * catalog.fuel_consumptions[index][vehicle.fuel] * \
+                    fo.fuel_emission_factors[index][vehicle.fuel]
+
+            # Demand: buy the cheapest option for each short cell that fits
+            # what is left of the carbon cap after serving the other short
+            # cells with their cleanest option, else the cleanest one
+            cap = fo.carbon_emissions[str(year)]
+            shortfall = [max(required - km, 0)
+                         for required, km in zip(demand_index.required[y].tolist(), covered)]
+            cleanest = fo.cleanest_new_emissions[y].tolist()
+            reserve = sum(e * short for e, short in zip(cleanest, shortfall))
+            for c, short in enumerate(shortfall):
+                options = fo.new_vehicle_options[y][c]
+                if short <= 0 or not options:
+                    continue
+                reserve -= cleanest[c] * short
+                choice, num_vehicles, distance = pick_new_vehicle(
+                    catalog, options, short, cap - emissions - reserve)
+                _, _, index, fuel = choice
+                bucket = demand_index.cells[c][1]
+                entry = FleetEntry(catalog.ids[index], num_vehicles,
+                                   catalog.yearly_range[index], bucket, fuel)
+                buy.append(entry)
+                use.append(entry._replace(distance_per_vehicle=distance))
+                covered[c] += num_vehicles * distance
+                emissions += num_vehicles * distance * catalog.fuel_consumptions[index][fuel] * \
+                    fo.fuel_emission_factors[index][fuel]
+                owned[entry.id] = owned.get(entry.id, 0) + num_vehicles
+                for later in range(y + 1, min(y + fo.max_vehicle_age, len(chromosome))):
+                    carried.setdefault(later, []).append(entry)
+                changed = True
+
+            # Emissions: switch the entries that save the most to their
+            # cleanest fuel until the cap holds
+            excess = emissions - cap
+            if excess > 0:
+                switches = []
+                for i, vehicle in enumerate(use):
+                    fuel_options = fo.fuel_options[y][catalog.index[vehicle.id]]
+                    for option in fuel_options:
+                        if option[2] == vehicle.fuel:
+                            saving = (option[0] - fuel_options[0][0]) * \
+                                vehicle.num_vehicles * vehicle.distance_per_vehicle
+                            if saving > 0:
+                                switches.append((saving, i, fuel_options[0][2]))
+                            break
+                switches.sort(reverse=True)
+                for saving, i, fuel in switches:
+                    if excess <= 0:
+                        break
+                    use[i] = use[i]._replace(fuel=fuel)
+                    excess -= saving
+                    changed = True
+
+            # Still over the cap: trim use that demand does not need, the
+            # highest emitters first
+            if excess > 0:
+                surplus = [km - required for km, required in
+                           zip(covered, demand_index.required[y].tolist())]
+                emitters = []
+                for i, vehicle in enumerate(use):
+                    index = catalog.index[vehicle.id]
+                    for emissions_per_km, _, fuel in fo.fuel_options[y][index]:
+                        if fuel == vehicle.fuel:
+                            emitters.append((emissions_per_km, i, index))
+                            break
+                emitters.sort(reverse=True)
+                for emissions_per_km, i, index in emitters:
+                    if excess <= 0:
+                        break
+                    vehicle = use[i]
+                    cell = cell_index.get(
+                        (catalog.size[index], vehicle.distance_bucket))
+                    if cell is None or vehicle.id not in eligible[y][cell]:
+                        num_vehicles = vehicle.num_vehicles
+                    else:
+                        num_vehicles = min(vehicle.num_vehicles,
+                                           int(surplus[cell] // vehicle.distance_per_vehicle))
+                        surplus[cell] -= num_vehicles * vehicle.distance_per_vehicle
+                    if num_vehicles <= 0:
+                        continue
+                    excess -= emissions_per_km * num_vehicles * vehicle.distance_per_vehicle
+                    use[i] = vehicle._replace(
+                        num_vehicles=vehicle.num_vehicles - num_vehicles)
+                    changed = True
+                use = [vehicle for vehicle in use if vehicle.num_vehicles > 0]
+
+            repaired.append(YearPlan(tuple(buy), tuple(sell), tuple(use))
+                            if changed else year_plan)
+
+        return tuple(repaired)
+
+    def evolve_generation(self):
+        timings = self.timings = dict.fromkeys(PHASES, 0.0)
+        clock = time.perf_counter
+
+        # Elites keep their place at the front, and their cached scores
+        elites = np.argsort(self.scores, kind='stable')[:self.elite_size]
+        new_population = [self.population[i] for i in elites]
+        new_population += self.breed(self.population_size - len(new_population))
+
+        self.population = new_population
+        start = clock()
+        self.score_population()
+        timings['evaluation'] += clock() - start
+
+        best = self.best_index()
+        return self.population[best], float(self.scores[best])
+
+    def breed(self, count):
+        # count children of selected parents, crossed over, mutated and
+        # repaired, adding the time of each phase to timings
+        timings = self.timings
+        clock = time.perf_counter
+        children = []
+        for _ in range(count):
+            start = clock()
+            parent1 = self.select_parents()
+            parent2 = self.select_parents()
+            selected = clock()
+            child = self.crossover(parent1, parent2)
+            crossed = clock()
+            child = self.mutate(child)
+            mutated = clock()
+            if self.repair_children:
+                child = self.repair(child)
+            timings['selection'] += selected - start
+            timings['crossover'] += crossed - selected
+            timings['mutation'] += mutated - crossed
+            timings['repair'] += clock() - mutated
+            children.append(child)
+        return children
+
+    def update_best(self):
+        # Keeps the best chromosome seen so far and counts the generations
+        # since the best fitness last improved by more than stall_tolerance
+        best = self.best_index()
+        fitness = float(self.scores[best])
+        if fitness < self.best_fitness - self.stall_tolerance:
+            self.stalled_generations = 0
+        else:
+            self.stalled_generations += 1
+        if self.best_chromosome is None or fitness < self.best_fitness:
+            self.best_chromosome = self.population[best]
+            self.best_fitness = fitness
+
+    def check_stop(self, start_time):
+        if self.target_fitness is not None and self.best_fitness <= self.target_fitness:
+            return 'target_fitness'
+        if self.stall_generations is not None and self.stalled_generations >= self.stall_generations:
+            return 'stalled'
+        if self.time_limit is not None and time.perf_counter() - start_time >= self.time_limit:
+            return 'time_limit'
+        if self.generation >= self.generations:
+            return 'generations'
+        return None
+
+    def save_checkpoint(self, file_path, start_time):
+        # The fitness cache is left out: pickling it dominated the write, and
+        # scoring is deterministic, so a resumed run only recomputes misses
+        write_checkpoint(file_path, {
+            'fitness_mode': self.fitness_mode,
+            'population': self.population,
+            'scores': self.scores,
+            'fitness_cache_counts': (self.fitness_cache.hits, self.fitness_cache.misses),
+            'best_chromosome': self.best_chromosome,
+            'best_fitness': self.best_fitness,
+            'generation': self.generation,
+            'stalled_generations': self.stalled_generations,
+            'elapsed': time.perf_counter() - start_time,
+            'random_state': random.getstate()
+        })
+
+    def load_checkpoint(self, file_path):
+        state = read_checkpoint(file_path)
+        if state['fitness_mode'] != self.fitness_mode:
+            raise ValueError(
+                f"Checkpoint {file_path} was written in fitness mode {state['fitness_mode']}, not {self.fitness_mode}.")
+        self.population = state['population']
+        self.scores = state['scores']
+        self.fitness_cache.clear()
+        self.fitness_cache.hits, self.fitness_cache.misses = state['fitness_cache_counts']
+        self.best_chromosome = state['best_chromosome']
+        self.best_fitness = state['best_fitness']
+        self.generation = state['generation']
+        self.stalled_generations = state['stalled_generations']
+        self.elapsed_before = state['elapsed']
+        random.setstate(state['random_state'])
 
     def evolve(self):
+        start_time = time.perf_counter()
+        self.population = []
         self.generate_initial_population()
+        self.scores = None
+        self.generation = 0
+        self.best_chromosome = None
+        self.best_fitness = float('inf')
+        self.stalled_generations = 0
+        self.elapsed_before = 0.0
+        return self.run_generations(start_time)
 
-        for generation in range(self.generations):
-            new_population = []
+    def resume(self, file_path=None):
+        # Continues a run from its checkpoint exactly as if it had not stopped
+        self.load_checkpoint(file_path or self.checkpoint_path)
+        return self.run_generations(time.perf_counter() - self.elapsed_before)
 
-            for _ in range(self.population_size):
-                parent1 = self.select_parents()
-                parent2 = self.select_parents()
-                child = self.crossover(parent1, parent2)
-                child = self.mutate(child)
-                new_population.append(child)
+    def generation_record(self, start_time, hits, misses):
+        # Summary statistics are over the finite scores. A chromosome counts
+        # as feasible when its score is finite, or in penalty mode when it
+        # has no violations.
+        scores = self.scores
+        finite = scores[np.isfinite(scores)]
+        record = {
+            'generation': self.generation,
+            'best_fitness': float(scores.min()),
+            'mean_fitness': float(finite.mean()) if len(finite) else None,
+            'median_fitness': float(np.median(finite)) if len(finite) else None,
+            'feasible_fraction': len(finite) / len(scores),
+            'cache_hit_rate': None,
+            'elapsed_seconds': time.perf_counter() - start_time,
+            'timings': dict(self.timings)
+        }
+        lookups = self.fitness_cache.hits - hits + self.fitness_cache.misses - misses
+        if lookups:
+            record['cache_hit_rate'] = (self.fitness_cache.hits - hits) / lookups
+        # Penalty and simulate mode cache the violations while scoring, so
+        # they are always reported; standard mode needs extra checks
+        if self.violation_metrics or self.fitness_mode in ('penalty', 'simulate'):
+            violations, feasible = self.population_violations()
+            record['violations'] = violations
+            if self.fitness_mode == 'penalty':
+                record['feasible_fraction'] = feasible / len(scores)
+        return record
 
-            self.population = new_population
+    def run_generations(self, start_time):
+        self.stop_reason = None
+        callbacks = list(self.callbacks)
+        metrics_writer = None
+        if self.metrics_path:
+            # A resumed run (already scored) continues the metrics file
+            metrics_writer = MetricsWriter(
+                self.metrics_path, list(self.fleet_optimization.constraint_weights),
+                resume_after=None if self.scores is None else self.generation)
+            callbacks.append(metrics_writer)
+        profiler = None
+        if self.profile_path:
+            profiler = cProfile.Profile()
+            profiler.enable()
 
-            best_chromosome = min(self.population, key=self.fitness)
-            best_fitness = self.fitness(best_chromosome)
+        try:
+            if self.scores is None:
+                # A new run: score the initial population
+                self.score_population()
+                self.update_best()
+                self.stalled_generations = 0
 
-            print(f"Generation {generation+1}: Best Fitness = {best_fitness}")
+            while True:
+                self.stop_reason = self.check_stop(start_time)
+                if self.stop_reason is not None:
+                    break
 
-        return min(self.population, key=self.fitness)
+                hits, misses = self.fitness_cache.hits, self.fitness_cache.misses
+                best_chromosome, best_fitness = self.evolve_generation()
+                self.generation += 1
+                self.update_best()
+
+                message = f"Generation {self.generation}: Best Fitness = {best_fitness}"
+                if self.fitness_mode == 'penalty':
+                    message += f", Violations = {self.violation_totals(best_chromosome)}"
+                print(message)
+
+                if self.checkpoint_path and self.generation % self.checkpoint_interval == 0:
+                    self.save_checkpoint(self.checkpoint_path, start_time)
+
+                if callbacks:
+                    record = self.generation_record(start_time, hits, misses)
+                    stop = False
+                    for callback in callbacks:
+                        stop = callback(self, record) or stop
+                    if stop:
+                        self.stop_reason = 'callback'
+                        break
+        finally:
+            self.close_pool()
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.profile_path)
+            if metrics_writer is not None:
+                metrics_writer.close()
+
+        if self.checkpoint_path:
+            self.save_checkpoint(self.checkpoint_path, start_time)
+        print(f"Stopped after {self.generation} generations ({self.stop_reason}): "
+              f"Best Fitness = {self.best_fitness}")
+        return self.best_chromosome
 
 
 def save_best_solution(best_solution, filename='best_solution.csv'):
@@ -165,8 +991,11 @@ def save_best_solution(best_solution, filename='best_solution.csv'):
 
 
 # Usage
-random.seed(33)
-fleet_optimization = FleetOptimization('dataset/mapping_and_cost_data.json')
-ga = GeneticAlgorithm(fleet_optimization)
-best_solution = ga.evolve()
-save_best_solution(best_solution)
+if __name__ == '__main__':
+    random.seed(33)
+    fleet_optimization = FleetOptimization(
+        'dataset/mapping_and_cost_data.bin')
+    ga = GeneticAlgorithm(fleet_optimization)
+    best_solution = ga.evolve()
+    save_best_solution(best_solution)
+
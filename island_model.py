@@ -0,0 +1,188 @@
+import multiprocessing
+import queue
+import random
+import time
+import traceback
+import numpy as np
+from fleet_decarbonization_model import FleetOptimization
+from genetic_algorithm import GeneticAlgorithm, save_best_solution
+
+
+def migration_targets(island_id, num_islands, topology):
+    if topology == 'ring':
+        return [(island_id + 1) % num_islands] if num_islands > 1 else []
+    elif topology == 'full':
+        return [i for i in range(num_islands) if i != island_id]
+    raise ValueError(
+        f"Invalid topology: {topology}. Must be 'ring' or 'full'.")
+
+
+def _receive_migrants(inbox, epoch, expected, pending):
+    # Faster neighbours may already have sent migrants for a later epoch, so
+    # messages are buffered by epoch until this island catches up
+    while len(pending.get(epoch, [])) < expected:
+        message_epoch, source, migrants = inbox.get()
+        pending.setdefault(message_epoch, []).append((source, migrants))
+
+    # Sort by source so the result does not depend on arrival order
+    arrivals = sorted(pending.pop(epoch, []), key=lambda item: item[0])
+    return [chromosome for _, migrants in arrivals for chromosome in migrants]
+
+
+def _run_island(island_id, fleet_optimization, ga_options, seed, generations,
+                migration_interval, migration_size, inboxes, targets, sources,
+                results):
+    # A failure is reported to the driver instead of leaving it waiting
+    try:
+        results.put(_evolve_island(island_id, fleet_optimization, ga_options, seed,
+                                   generations, migration_interval, migration_size,
+                                   inboxes, targets, sources))
+    except Exception:
+        results.put({'island': island_id, 'error': traceback.format_exc()})
+
+
+def _evolve_island(island_id, fleet_optimization, ga_options, seed, generations,
+                   migration_interval, migration_size, inboxes, targets, sources):
+    random.seed(seed)
+    ga = GeneticAlgorithm(fleet_optimization, **ga_options)
+    inbox = inboxes[island_id]
+    pending = {}
+    history = []
+    migrants_received = 0
+
+    start = time.perf_counter()
+    try:
+        ga.generate_initial_population()
+        ga.score_population()
+
+        for generation in range(1, generations + 1):
+            _, best_fitness = ga.evolve_generation()
+            history.append(best_fitness)
+
+            if generation % migration_interval == 0 and generation < generations:
+                epoch = generation // migration_interval
+                ranked = np.argsort(ga.scores, kind='stable')
+
+                # Send copies of this island's best chromosomes to its neighbours
+                emigrants = [ga.population[i] for i in ranked[:migration_size]]
+                for target in targets:
+                    inboxes[target].put((epoch, island_id, emigrants))
+
+                # Replace the worst chromosomes with the incoming migrants
+                immigrants = _receive_migrants(
+                    inbox, epoch, len(sources), pending)
+                worst = ranked[len(ranked) - len(immigrants):]
+                for i, chromosome in zip(worst, immigrants):
+                    ga.population[i] = chromosome
+                ga.score_population()
+                migrants_received += len(immigrants)
+    finally:
+        ga.close_pool()
+
+    best = ga.best_index()
+    return {
+        'island': island_id,
+        'seed': seed,
+        'best_fitness': float(ga.scores[best]),
+        'best_chromosome': ga.population[best],
+        'history': history,
+        'migrants_received': migrants_received,
+        'fitness_evaluations': ga.fitness_cache.misses,
+        'cache_hit_rate': ga.fitness_cache.hit_rate(),
+        'elapsed_seconds': time.perf_counter() - start
+    }
+
+
+def _collect_results(results, processes, poll_interval=1.0):
+    # Drains one result per island. An island that fails (or dies without
+    # reporting) would leave the others waiting for its migrants, so every
+    # island is stopped and the failure raised.
+    islands = []
+    failure = None
+    while len(islands) < len(processes) and failure is None:
+        try:
+            island = results.get(timeout=poll_interval)
+        except queue.Empty:
+            for island_id, process in enumerate(processes):
+                if process.exitcode not in (None, 0):
+                    failure = f"Island {island_id} exited with code {process.exitcode}"
+            continue
+        if 'error' in island:
+            failure = f"Island {island['island']} failed:\n{island['error']}"
+        else:
+            islands.append(island)
+
+    if failure is not None:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        raise RuntimeError(failure)
+    return islands
+
+
+def run_islands(fleet_optimization, num_islands=4, population_size=100,
+                generations=650, migration_interval=10, migration_size=2,
+                topology='ring', seed=33, ga_options=None):
+    # Each island is an independent GeneticAlgorithm in its own process.
+    # Every migration_interval generations the islands exchange their best
+    # migration_size chromosomes along the chosen topology.
+    ga_options = dict(ga_options or {})
+    ga_options.update(population_size=population_size,
+                      generations=generations)
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(num_islands)]
+    results = context.Queue()
+
+    targets = [migration_targets(i, num_islands, topology)
+               for i in range(num_islands)]
+    sources = [[j for j in range(num_islands) if i in targets[j]]
+               for i in range(num_islands)]
+
+    processes = []
+    for island_id in range(num_islands):
+        process = context.Process(
+            target=_run_island,
+            args=(island_id, fleet_optimization, ga_options, seed + island_id,
+                  generations, migration_interval, migration_size, inboxes,
+                  targets[island_id], sources[island_id], results))
+        process.start()
+        processes.append(process)
+
+    # Drain the results before joining so large payloads cannot block exit
+    islands = _collect_results(results, processes)
+    for process in processes:
+        process.join()
+
+    islands.sort(key=lambda island: island['island'])
+    best = min(islands, key=lambda island: island['best_fitness'])
+    return {
+        'best_fitness': best['best_fitness'],
+        'best_chromosome': best['best_chromosome'],
+        'best_island': best['island'],
+        'islands': islands
+    }
+
+
+def print_island_statistics(summary):
+    for island in summary['islands']:
+        print(f"Island {island['island']} (seed {island['seed']}): "
+              f"Best Fitness = {island['best_fitness']}, "
+              f"Evaluations = {island['fitness_evaluations']}, "
+              f"Cache Hit Rate = {island['cache_hit_rate']:.2%}, "
+              f"Migrants Received = {island['migrants_received']}, "
+              f"Time = {island['elapsed_seconds']:.1f}s")
+    print(f"Best Island: {summary['best_island']}, "
+          f"Best Fitness = {summary['best_fitness']}")
+
+
+# Usage
+if __name__ == '__main__':
+    fleet_optimization = FleetOptimization(
+        'dataset/mapping_and_cost_data.bin')
+    summary = run_islands(fleet_optimization,
+                          num_islands=multiprocessing.cpu_count())
+    print_island_statistics(summary)
+    save_best_solution(summary['best_chromosome'])
@@ -0,0 +1,322 @@
+import math
+import time
+import numpy as np
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import coo_array
+from chromosome import FleetEntry, YearPlan
+from fleet_decarbonization_model import FleetOptimization
+from genetic_algorithm import save_best_solution
+
+
+class FleetMILP:
+    # The fleet plan as a mixed-integer linear program over the same rules and
+    # tables as FleetOptimization.simulate_plan:
+    #   buy[v]            vehicles of v bought in its model year (integer)
+    #   sell[v, t]        vehicles of v sold in year t (integer)
+    #   use[v, f, d, t]   vehicles of v used on fuel f in bucket d (integer)
+    #   km[v, f, d, t]    km they drive in total (continuous)
+    # Every vehicle still owned must be used when require_use is set. The
+    # model's resale values exceed purchase costs, so without it buying idle
+    # vehicles only to resell them would make the problem unbounded.
+    def __init__(self, fleet_optimization, require_use=True, margin=1.0):
+        self.fleet_optimization = fleet_optimization
+        self.require_use = require_use
+        # Demand rows and carbon caps are tightened by margin km/kg, so solver
+        # tolerances cannot produce a plan that just misses either
+        self.margin = margin
+
+        self.costs = []
+        self.integrality = []
+        self.upper = []
+        self.rows = []
+        self.cols = []
+        self.values = []
+        self.lower_bounds = []
+        self.upper_bounds = []
+        self._build()
+
+    def _variable(self, cost, integer, upper=np.inf):
+        self.costs.append(cost)
+        self.integrality.append(1 if integer else 0)
+        self.upper.append(upper)
+        return len(self.costs) - 1
+
+    def _constraint(self, terms, lower, upper):
+        row = len(self.lower_bounds)
+        for column, value in terms:
+            self.rows.append(row)
+            self.cols.append(column)
+            self.values.append(value)
+        self.lower_bounds.append(lower)
+        self.upper_bounds.append(upper)
+
+    def _build(self):
+        fo = self.fleet_optimization
+        catalog = fo.catalog
+        demand_index = fo.demand_index
+        years = fo.years
+        start_year = years[0]
+
+        self.buy = {}
+        self.sell = {}
+        self.use = {}
+        self.km = {}
+        active = {y: [] for y in range(len(years))}
+        for index, vehicle_id in enumerate(catalog.ids):
+            purchase_year = catalog.year[index]
+            if purchase_year not in years:
+                continue
+            self.buy[index] = self._variable(catalog.cost[index], True)
+            level = fo.distance_levels[catalog.distance[index]]
+            for year in range(purchase_year, min(purchase_year + fo.max_vehicle_age, years[-1] + 1)):
+                y = year - start_year
+                age = fo.age_index(year - purchase_year)
+                active[y].append(index)
+                self.sell[index, y] = self._variable(
+                    -fo.resale_values[index][age], True)
+                fixed_cost = fo.insurance_costs[index][age] + \
+                    fo.maintenance_costs[index][age]
+                for fuel, consumption in catalog.fuel_consumptions[index].items():
+                    fuel_cost = consumption * \
+                        fo.fuels_data[fuel][str(year)]['Cost ($/unit_fuel)']
+                    for bucket in fo.distance_buckets:
+                        if fo.distance_levels[bucket] > level:
+                            continue
+                        key = (index, fuel, bucket, y)
+                        self.use[key] = self._variable(fixed_cost, True)
+                        self.km[key] = self._variable(fuel_cost, False)
+
+        # Owned vehicles per year: bought minus sold so far, never negative,
+        # and all of them (or at most all of them) in use
+        self.uses_by_vehicle = {}
+        for key in self.use:
+            self.uses_by_vehicle.setdefault(key[0::3], []).append(key)
+        for y in range(len(years)):
+            for index in active[y]:
+                owned = [(self.buy[index], 1)] + [(self.sell[index, t], -1)
+                                                  for t in range(y + 1) if (index, t) in self.sell]
+                self._constraint(owned, 0, np.inf)
+                used = [(self.use[key], -1)
+                        for key in self.uses_by_vehicle[index, y]]
+                self._constraint(owned + used, 0,
+                                 0 if self.require_use else np.inf)
+
+        # The 20% sell cap, against the fleet after the year's purchases
+        for y in range(len(years)):
+            terms = []
+            for index in active[y]:
+                terms.append((self.buy[index], fo.max_sell_percentage))
+                terms.extend((self.sell[index, t], -fo.max_sell_percentage)
+                             for t in range(y) if (index, t) in self.sell)
+                terms.append((self.sell[index, y], -1))
+            self._constraint(terms, 0, np.inf)
+
+        # Distance driven is limited by each vehicle's yearly range
+        for key, use in self.use.items():
+            self._constraint(
+                [(self.km[key], 1), (use, -catalog.yearly_range[key[0]])], -np.inf, 0)
+
+        # Demand per (size, bucket) cell from eligible vehicles, and carbon caps
+        for y, year in enumerate(years):
+            eligible = demand_index.eligible[y]
+            for c, (size, bucket) in enumerate(demand_index.cells):
+                required = demand_index.required[y, c]
+                if required <= 0:
+                    continue
+                terms = [(self.km[key], 1) for key in self.km
+                         if key[3] == y and key[2] == bucket and catalog.size[key[0]] == size
+                         and catalog.ids[key[0]] in eligible[c]]
+                self._constraint(terms, required + self.margin, np.inf)
+
+            terms = []
+            for key, km in self.km.items():
+                if key[3] != y:
+                    continue
+                index, fuel = key[0], key[1]
+                terms.append((km, catalog.fuel_consumptions[index][fuel] *
+                              fo.fuels_data[fuel][str(year)]['Emissions (CO2/unit_fuel)']))
+            self._constraint(
+                terms, -np.inf, fo.carbon_emissions[str(year)] - self.margin)
+
+    def _solve(self, integrality, upper, time_limit=None, mip_rel_gap=None, verbose=False):
+        options = {'disp': verbose}
+        if time_limit is not None:
+            options['time_limit'] = max(time_limit, 0.1)
+        if mip_rel_gap is not None:
+            options['mip_rel_gap'] = mip_rel_gap
+        return milp(self.cost_vector, integrality=integrality, bounds=Bounds(0, upper),
+                    constraints=self.constraints, options=options)
+
+    def round_relaxation(self, x):
+        # Integer plan from the LP relaxation with the same km: just enough
+        # vehicles per use entry for its km, sells rounded down and buys
+        # rounded up so every year owns at least what it uses, and any spare
+        # owned vehicles added to the largest entry. Demand and emissions
+        # depend only on km, and the sell cap only gets looser, so the result
+        # stays feasible.
+        catalog = self.fleet_optimization.catalog
+        rounded = np.zeros_like(x)
+        needed = {}
+        for key, column in self.use.items():
+            rounded[self.km[key]] = x[self.km[key]]
+            rounded[column] = math.ceil(
+                x[self.km[key]] / catalog.yearly_range[key[0]] - 1e-9)
+            needed[key[0], key[3]] = needed.get(
+                (key[0], key[3]), 0) + rounded[column]
+        for column in self.sell.values():
+            rounded[column] = math.floor(x[column] + 1e-9)
+
+        for index, column in self.buy.items():
+            buy = math.ceil(x[column] - 1e-9)
+            sold = 0
+            for y in range(len(self.fleet_optimization.years)):
+                if (index, y) in self.sell:
+                    sold += rounded[self.sell[index, y]]
+                    buy = max(buy, needed.get((index, y), 0) + sold)
+            rounded[column] = buy
+
+        for (index, y), keys in self.uses_by_vehicle.items():
+            owned = rounded[self.buy[index]] - sum(rounded[self.sell[index, t]]
+                                                   for t in range(y + 1) if (index, t) in self.sell)
+            spare = owned - needed.get((index, y), 0)
+            if spare > 0 and self.require_use:
+                largest = max(keys, key=lambda key: rounded[self.use[key]])
+                rounded[self.use[largest]] += spare
+        return rounded
+
+    def support(self, chromosome):
+        # Columns of the buy, sell and use decisions a plan makes
+        fo = self.fleet_optimization
+        catalog = fo.catalog
+        columns = []
+        for y, year_dict in enumerate(chromosome):
+            for vehicle in year_dict['buy']:
+                index = catalog.index.get(vehicle['ID'])
+                if index in self.buy:
+                    columns.append(self.buy[index])
+            for vehicle in year_dict['sell']:
+                index = catalog.index.get(vehicle['ID'])
+                if (index, y) in self.sell:
+                    columns.append(self.sell[index, y])
+            for vehicle in year_dict['use']:
+                key = (catalog.index.get(vehicle['ID']), vehicle['Fuel'],
+                       vehicle['Distance_bucket'], y)
+                if key in self.use:
+                    columns.extend((self.use[key], self.km[key]))
+        return columns
+
+    def solve(self, time_limit=None, mip_rel_gap=None, warm_start=None, full=False,
+              verbose=False):
+        # The LP relaxation gives a lower bound and a rounded feasible plan.
+        # The MILP is then solved over the columns the relaxation (and the
+        # warm start plan, if given) uses, or over every column when full is
+        # set, within what is left of time_limit. scipy's HiGHS interface
+        # takes no MIP start, so the warm start plan also stays the incumbent
+        # if nothing better is found.
+        start = time.perf_counter()
+        matrix = coo_array((self.values, (self.rows, self.cols)),
+                           shape=(len(self.lower_bounds), len(self.costs))).tocsr()
+        self.cost_vector = np.array(self.costs)
+        self.constraints = LinearConstraint(
+            matrix, self.lower_bounds, self.upper_bounds)
+        upper = np.array(self.upper)
+        integrality = np.array(self.integrality)
+
+        relaxation = self._solve(np.zeros_like(integrality), upper)
+        solution = {
+            'status': relaxation.status,
+            'message': relaxation.message,
+            'source': None,
+            'chromosome': None,
+            'total_cost': float('inf'),
+            'bound': relaxation.fun,
+            'gap': None
+        }
+        if relaxation.x is None:
+            return solution
+
+        def consider(x, source):
+            chromosome = self.decode(x)
+            simulated = self.fleet_optimization.simulate_plan(chromosome)
+            if simulated['feasible'] and simulated['total_cost'] < solution['total_cost']:
+                solution.update(source=source, chromosome=chromosome,
+                                total_cost=simulated['total_cost'])
+
+        consider(self.round_relaxation(relaxation.x), 'rounded')
+
+        if not full:
+            restricted = np.zeros_like(upper)
+            columns = np.flatnonzero(relaxation.x > 1e-9)
+            if warm_start is not None:
+                columns = np.concatenate(
+                    [columns, np.array(self.support(warm_start), dtype=np.int64)])
+            restricted[columns] = upper[columns]
+            upper = restricted
+        remaining = None
+        if time_limit is not None:
+            remaining = time_limit - (time.perf_counter() - start)
+        result = self._solve(integrality, upper, remaining, mip_rel_gap, verbose)
+        solution.update(status=result.status, message=result.message)
+        if result.x is not None:
+            consider(result.x, 'milp')
+        if full and getattr(result, 'mip_dual_bound', None) is not None:
+            solution['bound'] = max(solution['bound'], result.mip_dual_bound)
+
+        if warm_start is not None:
+            simulated = self.fleet_optimization.simulate_plan(warm_start)
+            if simulated['feasible'] and simulated['total_cost'] < solution['total_cost']:
+                solution.update(source='warm_start', chromosome=warm_start,
+                                total_cost=simulated['total_cost'])
+
+        if solution['chromosome'] is not None:
+            solution['gap'] = (solution['total_cost'] -
+                               solution['bound']) / abs(solution['total_cost'])
+        return solution
+
+    def decode(self, x):
+        fo = self.fleet_optimization
+        catalog = fo.catalog
+        counts = np.rint(x).astype(np.int64)
+        plan = [([], [], []) for _ in fo.years]
+
+        for index, column in self.buy.items():
+            if counts[column] > 0:
+                y = catalog.year[index] - fo.years[0]
+                plan[y][0].append(FleetEntry(
+                    catalog.ids[index], int(counts[column]), 0.0, None, None))
+        for (index, y), column in self.sell.items():
+            if counts[column] > 0:
+                plan[y][1].append(FleetEntry(
+                    catalog.ids[index], int(counts[column]), 0.0, None, None))
+        for key, column in self.use.items():
+            num_vehicles = int(counts[column])
+            if num_vehicles > 0:
+                index, fuel, bucket, y = key
+                distance = min(max(x[self.km[key]], 0.0) / num_vehicles,
+                               catalog.yearly_range[index])
+                plan[y][2].append(FleetEntry(
+                    catalog.ids[index], num_vehicles, distance, bucket, fuel))
+
+        return tuple(YearPlan(tuple(buy), tuple(sell), tuple(use)) for buy, sell, use in plan)
+
+
+def solve_fleet_milp(fleet_optimization, time_limit=None, mip_rel_gap=None,
+                     warm_start=None, output_file=None, require_use=True, full=False):
+    solution = FleetMILP(fleet_optimization, require_use=require_use).solve(
+        time_limit=time_limit, mip_rel_gap=mip_rel_gap, warm_start=warm_start, full=full)
+    if output_file is not None and solution['chromosome'] is not None:
+        save_best_solution(solution['chromosome'], output_file)
+    return solution
+
+
+# Usage
+if __name__ == '__main__':
+    fleet_optimization = FleetOptimization(
+        'dataset/mapping_and_cost_data.bin')
+    solution = solve_fleet_milp(fleet_optimization, time_limit=60,
+                                output_file='best_solution.csv')
+    # There is no gap when no feasible plan was found
+    gap = 'n/a' if solution['gap'] is None else f"{solution['gap']:.2%}"
+    print(f"{solution['message']} Source = {solution['source']}, "
+          f"Total Cost = {solution['total_cost']}, Bound = {solution['bound']}, "
+          f"Gap = {gap}")
@@ -0,0 +1,214 @@
+import bisect
+import csv
+import os
+import random
+import time
+import numpy as np
+from fleet_decarbonization_model import FleetOptimization
+from genetic_algorithm import GeneticAlgorithm, chromosome_key, save_best_solution
+from telemetry import PHASES
+
+
+def fast_non_dominated_sort(objectives):
+    # Front number of every row of an (individual, objective) array, 0 being
+    # the non-dominated front. Two objectives take an O(N log N) sweep,
+    # more take a vectorized pairwise comparison.
+    objectives = np.asarray(objectives, dtype=float)
+    if objectives.shape[1] == 2:
+        return _sort_two_objectives(objectives)
+
+    ranks = np.full(len(objectives), -1)
+    no_worse = (objectives[:, None, :] <= objectives[None, :, :]).all(axis=2)
+    better = (objectives[:, None, :] < objectives[None, :, :]).any(axis=2)
+    dominates = no_worse & better
+    dominated_by = dominates.sum(axis=0)
+    front = np.flatnonzero(dominated_by == 0)
+    rank = 0
+    while len(front):
+        ranks[front] = rank
+        dominated_by -= dominates[front].sum(axis=0)
+        dominated_by[front] = -1
+        front = np.flatnonzero(dominated_by == 0)
+        rank += 1
+    return ranks
+
+
+def _sort_two_objectives(objectives):
+    # In lexicographic order each point joins the first front whose latest
+    # point has a larger second objective (or is the same point); those
+    # latest values increase from front to front, so a bisection finds it
+    order = np.lexsort((objectives[:, 1], objectives[:, 0]))
+    ranks = np.empty(len(objectives), dtype=np.int64)
+    last_second = []
+    last_point = []
+    for i in order:
+        first, second = objectives[i]
+        rank = bisect.bisect_right(last_second, second)
+        if rank > 0 and last_point[rank - 1] == (first, second):
+            rank -= 1
+        if rank == len(last_second):
+            last_second.append(second)
+            last_point.append((first, second))
+        else:
+            last_second[rank] = second
+            last_point[rank] = (first, second)
+        ranks[i] = rank
+    return ranks
+
+
+def crowding_distance(objectives, ranks):
+    # Per front, the normalised size of the box each point's neighbours span
+    # along every objective; the extremes of each front are kept at inf
+    objectives = np.asarray(objectives, dtype=float)
+    distance = np.zeros(len(objectives))
+    for rank in np.unique(ranks):
+        front = np.flatnonzero(ranks == rank)
+        values = objectives[front]
+        for m in range(values.shape[1]):
+            order = np.argsort(values[:, m], kind='stable')
+            sorted_values = values[order, m]
+            span = sorted_values[-1] - sorted_values[0]
+            gaps = np.zeros(len(front))
+            if span > 0 and np.isfinite(span) and len(front) > 2:
+                gaps[1:-1] = (sorted_values[2:] - sorted_values[:-2]) / span
+            gaps[0] = gaps[-1] = np.inf
+            distance[front[order]] += gaps
+    return distance
+
+
+def constrained_ranks(objectives, violations):
+    # Feasible plans are ranked on their objectives; infeasible ones come
+    # after every feasible front, ordered by total violation alone
+    ranks = np.empty(len(objectives), dtype=np.int64)
+    feasible = violations <= 0
+    next_rank = 0
+    if feasible.any():
+        ranks[feasible] = fast_non_dominated_sort(objectives[feasible])
+        next_rank = ranks[feasible].max() + 1
+    if (~feasible).any():
+        _, levels = np.unique(violations[~feasible], return_inverse=True)
+        ranks[~feasible] = next_rank + levels
+    return ranks
+
+
+class ParetoGeneticAlgorithm(GeneticAlgorithm):
+    # NSGA-II over (total cost, total emissions) from simulate_plan, with the
+    # plan's constraint penalty deciding between infeasible plans. Children
+    # and parents compete for the next generation by front and crowding
+    # distance. scores holds the cost of feasible plans (inf otherwise), so
+    # reporting, stopping and checkpoints work as in GeneticAlgorithm.
+    def __init__(self, fleet_optimization, **options):
+        options.setdefault('fitness_mode', 'simulate')
+        # Both score plans as a single float, not the three values ranked here
+        if options.get('vectorized'):
+            raise ValueError("ParetoGeneticAlgorithm does not support vectorized scoring.")
+        if options['fitness_mode'] == 'robust':
+            raise ValueError("ParetoGeneticAlgorithm does not support the 'robust' fitness mode.")
+        super().__init__(fleet_optimization, **options)
+        self.values = None
+        self.objectives = None
+        self.violations = None
+        self.ranks = None
+        self.crowding = None
+
+    def calculate_fitness(self, chromosome, year_keys=None):
+        result = self.fleet_optimization.simulate_plan(
+            chromosome, stop_at_first_violation=False)
+        self.violation_cache.put(chromosome_key(
+            chromosome), result['violation_totals'])
+        return (result['total_cost'], result['total_emissions'],
+                self.fleet_optimization.constraint_penalty(result['violation_totals']))
+
+    def check_violations(self, chromosome):
+        # Feasibility is ranked on the whole plan's violations
+        return self.fleet_optimization.simulate_plan(
+            chromosome, stop_at_first_violation=False)['violation_totals']
+
+    def score_population(self):
+        values = np.array(self.evaluate_population(
+            self.population), dtype=float).reshape(-1, 3)
+        return self.rank_population(values)
+
+    def rank_population(self, values):
+        self.values = values
+        self.objectives = values[:, :2]
+        self.violations = values[:, 2]
+        self.ranks = constrained_ranks(self.objectives, self.violations)
+        self.crowding = crowding_distance(self.objectives, self.ranks)
+        self.scores = np.where(self.violations <= 0, values[:, 0], np.inf)
+        return self.scores
+
+    def select_parents(self):
+        # Binary tournament: lower front first, then larger crowding distance
+        first, second = random.sample(range(len(self.population)), 2)
+        if (self.ranks[second], -self.crowding[second]) < (self.ranks[first], -self.crowding[first]):
+            first = second
+        return self.population[first]
+
+    def evolve_generation(self):
+        timings = self.timings = dict.fromkeys(PHASES, 0.0)
+        clock = time.perf_counter
+
+        children = self.breed(self.population_size)
+
+        # Parents and children together, best fronts first and the last
+        # front that fits cut by crowding distance
+        start = clock()
+        self.population = self.population + children
+        self.score_population()
+        survivors = np.lexsort((-self.crowding, self.ranks))[:self.population_size]
+        self.population = [self.population[i] for i in survivors]
+        self.rank_population(self.values[survivors])
+        timings['evaluation'] += clock() - start
+
+        best = self.best_index()
+        return self.population[best], float(self.scores[best])
+
+    def load_checkpoint(self, file_path):
+        super().load_checkpoint(file_path)
+        self.score_population()
+
+    def pareto_front(self):
+        # Distinct feasible non-dominated plans, cheapest first
+        front = {}
+        for i in np.flatnonzero((self.ranks == 0) & (self.violations <= 0)):
+            front.setdefault(chromosome_key(self.population[i]), i)
+        order = sorted(front.values(), key=lambda i: tuple(self.objectives[i]))
+        return [{'chromosome': self.population[i],
+                 'total_cost': float(self.objectives[i, 0]),
+                 'total_emissions': float(self.objectives[i, 1])} for i in order]
+
+    def evolve(self):
+        super().evolve()
+        return self.pareto_front()
+
+
+def save_pareto_front(front, directory='pareto_front'):
+    # One save_best_solution CSV per plan, plus a summary of the trade-off
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'front.csv'), mode='w', newline='') as file:
+        writer = csv.DictWriter(
+            file, fieldnames=['Plan', 'Total_Cost', 'Total_Emissions', 'File'])
+        writer.writeheader()
+        for i, plan in enumerate(front):
+            filename = f'solution_{i}.csv'
+            save_best_solution(
+                plan['chromosome'], os.path.join(directory, filename))
+            writer.writerow({'Plan': i,
+                             'Total_Cost': plan['total_cost'],
+                             'Total_Emissions': plan['total_emissions'],
+                             'File': filename})
+
+
+# Usage
+if __name__ == '__main__':
+    random.seed(33)
+    fleet_optimization = FleetOptimization(
+        'dataset/mapping_and_cost_data.bin')
+    nsga = ParetoGeneticAlgorithm(fleet_optimization, population_size=100,
+                                  generations=100, repair=True)
+    front = nsga.evolve()
+    for plan in front:
+        print(f"Total Cost = {plan['total_cost']}, "
+              f"Total Emissions = {plan['total_emissions']}")
+    save_pareto_front(front)
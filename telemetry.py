@@ -0,0 +1,80 @@
+import csv
+import json
+import os
+import pstats
+
+PHASES = ('selection', 'crossover', 'mutation', 'repair', 'evaluation')
+
+
+class MetricsWriter:
+    # Streams one record per generation to a JSON Lines (.jsonl) or CSV
+    # (.csv) file. It is a GeneticAlgorithm callback, so it can be passed in
+    # callbacks as well as created through metrics_path. A run resumed from
+    # a checkpoint at generation resume_after keeps the file's records up to
+    # that generation and appends after them.
+    def __init__(self, file_path, constraints=(), metrics_format=None, resume_after=None):
+        if metrics_format is None:
+            metrics_format = 'csv' if file_path.endswith('.csv') else 'jsonl'
+        if metrics_format not in ('jsonl', 'csv'):
+            raise ValueError(
+                f"Invalid metrics format: {metrics_format}. Must be 'jsonl' or 'csv'.")
+        self.file_path = file_path
+        self.metrics_format = metrics_format
+
+        # Records past the checkpoint were written by the interrupted run
+        # and will be written again
+        kept = []
+        if resume_after is not None and os.path.exists(file_path):
+            kept = [record for record in read_metrics(file_path)
+                    if int(record['generation']) <= resume_after]
+        self.file = open(file_path, 'w', newline='')
+
+        self.writer = None
+        if metrics_format == 'csv':
+            # Nested values are flattened into fixed columns
+            fieldnames = ['generation', 'best_fitness', 'mean_fitness', 'median_fitness',
+                          'feasible_fraction', 'cache_hit_rate', 'elapsed_seconds']
+            fieldnames += [f'time_{phase}' for phase in PHASES]
+            fieldnames += [f'violations_{constraint}' for constraint in constraints]
+            self.writer = csv.DictWriter(self.file, fieldnames=fieldnames,
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+            self.writer.writerows(kept)
+        else:
+            for record in kept:
+                self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def __call__(self, ga, record):
+        self.write(record)
+
+    def write(self, record):
+        if self.writer is None:
+            self.file.write(json.dumps(record) + '\n')
+        else:
+            row = dict(record)
+            for phase, seconds in record['timings'].items():
+                row[f'time_{phase}'] = seconds
+            for constraint, amount in (record.get('violations') or {}).items():
+                row[f'violations_{constraint}'] = amount
+            self.writer.writerow(row)
+        # Flush every generation so the stream can be followed while running
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_metrics(file_path):
+    if file_path.endswith('.csv'):
+        with open(file_path, newline='') as file:
+            return list(csv.DictReader(file))
+    with open(file_path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def print_profile(file_path, limit=20):
+    # Cumulative time of the fitness and cost kernels from a profile_path dump
+    stats = pstats.Stats(file_path)
+    stats.sort_stats('cumulative').print_stats(
+        'fitness|calculate_|simulate_plan|evaluate|repair', limit)
@@ -0,0 +1,23 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fleet_decarbonization_model import FleetOptimization
+
+
+@pytest.fixture(scope='session')
+def json_dataset():
+    return os.path.join(ROOT, 'dataset', 'mapping_and_cost_data.json')
+
+
+@pytest.fixture(scope='session')
+def compiled_dataset():
+    return os.path.join(ROOT, 'dataset', 'mapping_and_cost_data.bin')
+
+
+@pytest.fixture(scope='module')
+def fleet_optimization(compiled_dataset):
+    return FleetOptimization(compiled_dataset)
@@ -0,0 +1,44 @@
+import random
+import numpy as np
+import pytest
+
+from batch_evaluation import BatchEvaluator
+from benchmark import synthetic_population
+from genetic_algorithm import GeneticAlgorithm
+
+
+def plans(fleet_optimization):
+    # Random, greedy (feasible) and synthetic plans of several fleet sizes
+    random.seed(7)
+    ga = GeneticAlgorithm(fleet_optimization, population_size=20)
+    ga.generate_initial_population()
+    greedy = GeneticAlgorithm(fleet_optimization, population_size=20, seeding='greedy')
+    greedy.generate_initial_population()
+    population = ga.population + greedy.population
+    for fleet_size in (10, 50):
+        population += synthetic_population(fleet_optimization, 10, fleet_size)
+    return population
+
+
+def test_year_totals_match_calculate_year(fleet_optimization):
+    population = plans(fleet_optimization)
+    ga = GeneticAlgorithm(fleet_optimization)
+    cost, emissions, feasible = BatchEvaluator(fleet_optimization).evaluate(population)
+    for p, chromosome in enumerate(population):
+        for y, year_dict in enumerate(chromosome):
+            year_cost, year_emissions, year_feasible = ga.calculate_year(
+                fleet_optimization.years[y], year_dict)
+            assert cost[p, y] == pytest.approx(year_cost, rel=1e-9, abs=1e-6)
+            assert emissions[p, y] == pytest.approx(year_emissions, rel=1e-9, abs=1e-6)
+            assert feasible[p, y] == year_feasible
+
+
+def test_fitness_matches_scalar(fleet_optimization):
+    population = plans(fleet_optimization)
+    ga = GeneticAlgorithm(fleet_optimization)
+    scalar = np.array([ga.calculate_fitness(chromosome) for chromosome in population])
+    batch = BatchEvaluator(fleet_optimization).fitness(population)
+    assert np.isfinite(scalar).any() and np.isinf(scalar).any()
+    np.testing.assert_array_equal(np.isfinite(batch), np.isfinite(scalar))
+    finite = np.isfinite(scalar)
+    np.testing.assert_allclose(batch[finite], scalar[finite], rtol=1e-9)
@@ -0,0 +1,26 @@
+import random
+import numpy as np
+
+from genetic_algorithm import GeneticAlgorithm
+
+
+def test_resume_matches_uninterrupted_run(fleet_optimization, tmp_path):
+    options = dict(population_size=20, repair=True, elite_size=2)
+
+    random.seed(11)
+    straight = GeneticAlgorithm(fleet_optimization, generations=6, **options)
+    straight.evolve()
+
+    checkpoint = str(tmp_path / 'run.ckpt')
+    random.seed(11)
+    first = GeneticAlgorithm(fleet_optimization, generations=3,
+                             checkpoint_path=checkpoint, **options)
+    first.evolve()
+    resumed = GeneticAlgorithm(fleet_optimization, generations=6,
+                               checkpoint_path=checkpoint, **options)
+    resumed.resume()
+
+    assert resumed.generation == straight.generation
+    assert resumed.best_fitness == straight.best_fitness
+    assert resumed.population == straight.population
+    np.testing.assert_array_equal(resumed.scores, straight.scores)
@@ -0,0 +1,50 @@
+import json
+import pickle
+import numpy as np
+import pytest
+
+from fleet_decarbonization_model import FleetOptimization, load_dataset
+
+
+@pytest.fixture(scope='module')
+def models(json_dataset, compiled_dataset):
+    return FleetOptimization(json_dataset), FleetOptimization(compiled_dataset)
+
+
+def test_compiled_loader_matches_json(json_dataset, compiled_dataset):
+    with open(json_dataset) as file:
+        assert load_dataset(compiled_dataset) == json.load(file)
+
+
+def test_compiled_model_matches_json(models):
+    json_model, compiled_model = models
+    for name in ('ids', 'year', 'cost', 'size', 'distance', 'yearly_range',
+                 'fuel_consumptions', 'details'):
+        assert getattr(compiled_model.catalog, name) == getattr(json_model.catalog, name)
+    for name in ('carbon_emissions', 'fuels_data', 'yearly_demand', 'insurance_costs',
+                 'maintenance_costs', 'resale_values', 'fuel_emission_factors',
+                 'fuel_unit_costs', 'fuel_options', 'new_vehicle_options'):
+        assert getattr(compiled_model, name) == getattr(json_model, name)
+    np.testing.assert_array_equal(compiled_model.demand_index.required,
+                                  json_model.demand_index.required)
+    np.testing.assert_array_equal(compiled_model.demand_index.eligible_mask,
+                                  json_model.demand_index.eligible_mask)
+    assert compiled_model.demand_index.eligible == json_model.demand_index.eligible
+
+    # The vehicle dicts are built on first use
+    assert 'vehicle_details' not in compiled_model.__dict__
+    assert compiled_model.vehicle_details == json_model.vehicle_details
+    assert compiled_model.vehicle_bucket_coverage == json_model.vehicle_bucket_coverage
+
+
+def test_pickle_keeps_in_memory_changes(compiled_dataset):
+    model = FleetOptimization(compiled_dataset)
+    model.carbon_emissions = {year: cap / 2 for year, cap in model.carbon_emissions.items()}
+    copy = pickle.loads(pickle.dumps(model))
+    assert copy.carbon_emissions == model.carbon_emissions
+    assert copy.catalog.ids == model.catalog.ids
+    assert copy.vehicle_details == model.vehicle_details
+    # The derived tables are rebuilt from the file rather than pickled
+    assert copy.insurance_costs == model.insurance_costs
+    assert copy.new_vehicle_options == model.new_vehicle_options
+    assert len(pickle.dumps(model)) < 20000
@@ -0,0 +1,9 @@
+import pytest
+
+from pareto import ParetoGeneticAlgorithm
+
+
+@pytest.mark.parametrize('options', [{'vectorized': True}, {'fitness_mode': 'robust'}])
+def test_rejects_single_value_scoring(fleet_optimization, options):
+    with pytest.raises(ValueError):
+        ParetoGeneticAlgorithm(fleet_optimization, **options)
@@ -0,0 +1,16 @@
+import random
+
+from genetic_algorithm import GeneticAlgorithm
+
+
+def test_unknown_distance_bucket_is_a_violation(fleet_optimization):
+    random.seed(5)
+    ga = GeneticAlgorithm(fleet_optimization, seeding='greedy')
+    plan = list(ga.seed_chromosome())
+    assert fleet_optimization.simulate_plan(plan)['feasible']
+
+    vehicle = plan[0].use[0]
+    plan[0] = plan[0]._replace(use=(vehicle._replace(distance_bucket='D9'),) + plan[0].use[1:])
+    result = fleet_optimization.simulate_plan(plan, stop_at_first_violation=False)
+    assert result['violation_totals']['distance_bucket'] == vehicle.num_vehicles
+    assert len(result['years']) == len(fleet_optimization.years)